@@ -0,0 +1,252 @@
+"""Benchmarks for the core transforms, run on synthetic workbooks.
+
+    python benchmark.py [--rows 10000 100000] [--only combine extract dnc omit] [--repeat N]
+    python benchmark.py --compare
+
+Each benchmark loads its inputs, runs the transform and saves the output, timing the whole
+run and then tracking its peak Python memory in a second run. Results are appended to a JSON
+lines file (benchmark_results.jsonl, or DLBEC_BENCHMARK_RESULTS) so runs can be compared over time.
+Everything runs in this process, without the load cache, so the numbers stay comparable.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import column_omitter
+import combiner
+import dnc_remover
+import extractor
+import loader
+import reader
+import writer
+
+
+# File the results are appended to
+RESULTS_PATH = os.environ.get("DLBEC_BENCHMARK_RESULTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.jsonl"))
+
+DEFAULT_ROWS = (10000, 100000)
+
+# Postcode areas to draw from, weighted towards the ones seen most in the real sheets
+POSTCODE_AREAS = ["B", "BS", "CV", "DY", "WS", "WV", "ST", "TF", "WR", "HR", "GL", "OX", "M", "L", "LS", "NG"]
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David", "Susan"]
+LAST_NAMES = ["Smith", "Jones", "Taylor", "Brown", "Williams", "Wilson", "Johnson", "Davies", "Patel", "Evans"]
+
+# Columns only some of the files have, so the combine has to align them
+OPTIONAL_COLUMNS = ["Email", "Second Number", "Company", "Notes"]
+
+BENCHMARKS = ("combine", "extract", "dnc", "omit")
+
+
+def generate_postcodes(rng, n):
+    """Returns n postcodes such as 'BS3 4EF', with some in lower case or without the space."""
+    areas = rng.choice(POSTCODE_AREAS, n)
+    districts = rng.integers(1, 30, n).astype(str)
+    sectors = rng.integers(0, 10, n).astype(str)
+    units = np.char.add(rng.choice(list("ABDEFGHJLNPQRSTUWXYZ"), n), rng.choice(list("ABDEFGHJLNPQRSTUWXYZ"), n))
+    postcodes = pd.Series(areas).str.cat([pd.Series(districts), pd.Series(" " + sectors), pd.Series(units)])
+    messy = rng.random(n)
+    postcodes = postcodes.where(messy > 0.05, postcodes.str.lower())
+    postcodes = postcodes.where((messy <= 0.05) | (messy > 0.1), postcodes.str.replace(" ", ""))
+    return postcodes
+
+
+def generate_phone_numbers(rng, n):
+    """Returns n UK mobile numbers written the different ways they turn up in the sheets."""
+    digits = pd.Series(rng.integers(100000000, 999999999, n).astype(str)).str.zfill(9)
+    styles = rng.integers(0, 3, n)
+    spaced = "07" + digits.str[:3] + " " + digits.str[3:]
+    international = "+447" + digits
+    plain = "07" + digits
+    return spaced.where(styles == 0, international.where(styles == 1, plain))
+
+
+def generate_frame(rows, seed=0, optional_columns=()):
+    """Builds a realistic main sheet with names, postcodes and phone numbers."""
+    rng = np.random.default_rng(seed)
+    data = {
+        "Name": pd.Series(rng.choice(FIRST_NAMES, rows)).str.cat(pd.Series(rng.choice(LAST_NAMES, rows)), sep=" "),
+        "Address": pd.Series(rng.integers(1, 300, rows).astype(str)) + " High Street",
+        "Postcode": generate_postcodes(rng, rows),
+        "First Number": generate_phone_numbers(rng, rows),
+        "Age": rng.integers(18, 95, rows),
+        "Score": rng.random(rows).round(3),
+    }
+    for column in optional_columns:
+        data[column] = pd.Series(rng.integers(0, 1000, rows).astype(str)).radd(f"{column.lower()}-")
+    return pd.DataFrame(data)
+
+
+def generate_workbook(save_path, rows, seed=0, optional_columns=()):
+    """Writes a synthetic workbook, reusing it if it was already generated."""
+    if not os.path.exists(save_path):
+        writer.write_frame(generate_frame(rows, seed, optional_columns), save_path)
+    return save_path
+
+
+def generate_inputs(workdir, rows):
+    """Generates the workbooks every benchmark needs for one row count."""
+    inputs = {
+        "parts": [
+            generate_workbook(os.path.join(workdir, f"part{i}-{rows}.xlsx"), rows // 4, seed=i, optional_columns=OPTIONAL_COLUMNS[i:i + 2])
+            for i in range(4)
+        ],
+        "main": generate_workbook(os.path.join(workdir, f"main-{rows}.xlsx"), rows, seed=10),
+    }
+    dnc_path = os.path.join(workdir, f"dnc-{rows}.xlsx")
+    if not os.path.exists(dnc_path):
+        # A tenth of the DNC numbers appear in the main sheet
+        main_numbers = generate_frame(rows, seed=10)["First Number"]
+        other_numbers = generate_phone_numbers(np.random.default_rng(11), rows // 10)
+        dnc_numbers = pd.concat([main_numbers.sample(frac=0.1, random_state=0), other_numbers], ignore_index=True)
+        writer.write_frame(pd.DataFrame({"Telephone Number": dnc_numbers}), dnc_path)
+    inputs["dnc"] = dnc_path
+    return inputs
+
+
+def bench_combine(inputs, outdir):
+    files_data = [(filepath, loader.read_excel(filepath, use_cache=False)) for filepath in inputs["parts"]]
+    combined_data = combiner.combine_data(files_data)
+    writer.write_frame(combined_data, os.path.join(outdir, "combined_data.xlsx"))
+    return len(combined_data)
+
+
+def bench_extract(inputs, outdir):
+    data = loader.read_excel(inputs["main"], use_cache=False)
+    prefixes = extractor.get_unique_postcode_prefixes(data, "Postcode")
+    filtered_data = extractor.filter_by_postcode(data, "Postcode", prefixes[0])
+    writer.write_frame(filtered_data, os.path.join(outdir, "filtered.xlsx"))
+    return len(data)
+
+
+def bench_dnc(inputs, outdir):
+    main_data = loader.read_excel(inputs["main"], use_cache=False)
+    dnc_data = loader.read_excel(inputs["dnc"], use_cache=False)
+    filtered_data = dnc_remover.remove_dnc_entries(main_data, dnc_data)
+    writer.write_frame(filtered_data, os.path.join(outdir, "suppressed.xlsx"))
+    return len(main_data)
+
+
+def bench_omit(inputs, outdir):
+    return column_omitter.omit_columns_from_workbook(inputs["main"], ["Address", "Score"], os.path.join(outdir, "omitted.xlsx"))
+
+
+def run_benchmark(name, inputs, track_memory=True):
+    """Runs one benchmark in a scratch folder and returns its wall time and peak memory.
+
+    tracemalloc slows everything down, so the peak memory is taken from a second, separate run.
+    """
+    bench = globals()[f"bench_{name}"]
+    with tempfile.TemporaryDirectory(prefix="dlbec-bench-") as outdir:
+        start = time.perf_counter()
+        rows = bench(inputs, outdir)
+        seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if track_memory:
+        with tempfile.TemporaryDirectory(prefix="dlbec-bench-") as outdir:
+            tracemalloc.start()
+            try:
+                bench(inputs, outdir)
+                peak_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            finally:
+                tracemalloc.stop()
+    return {"rows": rows, "seconds": round(seconds, 4), "peak_mb": peak_mb}
+
+
+def get_revision():
+    """Returns the current git commit, if the tools are run from a checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_results(results, results_path=RESULTS_PATH):
+    with open(results_path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def load_results(results_path=RESULTS_PATH):
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_results(results):
+    """Returns one line per benchmark and size comparing its latest run with the one before."""
+    runs = {}
+    for result in results:
+        runs.setdefault((result["benchmark"], result["size"]), []).append(result)
+
+    lines = []
+    for (name, size), history in sorted(runs.items()):
+        latest = history[-1]
+        line = f"{name:<8} {size:>8} rows  {latest['seconds']:>8.2f}s  {latest['peak_mb'] or 0:>8.1f} MB  ({latest.get('revision') or '?'})"
+        if len(history) > 1:
+            previous = history[-2]
+            change = (latest["seconds"] - previous["seconds"]) / previous["seconds"] * 100 if previous["seconds"] else 0
+            line += f"  {change:+.1f}% vs {previous.get('revision') or '?'}"
+        lines.append(line)
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Time and memory-profile the DLBEC transforms on synthetic workbooks.")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="Row counts to benchmark (10000 to 1000000).")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS), help="Benchmarks to run.")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to run each benchmark.")
+    parser.add_argument("--workdir", help="Folder for the synthetic workbooks (kept between runs when given).")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON lines file the results are appended to.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the separate memory-tracking run.")
+    parser.add_argument("--compare", action="store_true", help="Only print the latest results against the previous run.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        for line in compare_results(load_results(args.results)):
+            print(line)
+        return 0
+
+    environment = {
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "reader": reader.get_engines()[0],
+        "machine": platform.machine(),
+    }
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dlbec-bench-data-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        for size in args.rows:
+            print(f"Generating workbooks with {size} rows...")
+            inputs = generate_inputs(workdir, size)
+            for name in args.only:
+                for _ in range(args.repeat):
+                    result = {"benchmark": name, "size": size, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), **environment}
+                    result.update(run_benchmark(name, inputs, track_memory=not args.no_memory))
+                    append_results([result], args.results)
+                    print(f"{name:<8} {size:>8} rows  {result['seconds']:>8.2f}s  {result['peak_mb'] or 0:>8.1f} MB")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
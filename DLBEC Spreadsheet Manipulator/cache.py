@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+# Folder holding the parsed copies of workbooks (set DLBEC_CACHE_DIR to move it)
+CACHE_DIR = os.environ.get("DLBEC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".dlbec_cache"))
+
+# Largest total size of the cache folder before the least recently used entries are removed
+CACHE_MAX_BYTES = int(os.environ.get("DLBEC_CACHE_MAX_MB", 1024)) * 1024 * 1024
+
+# Set DLBEC_CACHE=0 to always parse workbooks from scratch
+CACHE_ENABLED = os.environ.get("DLBEC_CACHE", "1") != "0"
+
+CACHE_EXTENSIONS = (".parquet", ".pkl")
+
+# Bumped whenever the loader parses workbooks differently, so older parsed copies are not reused
+CACHE_VERSION = 2
+
+
+def _cache_key(filepath):
+    """Builds the cache key from the cache version and the file's absolute path, size and modification time."""
+    stat = os.stat(filepath)
+    identity = f"{CACHE_VERSION}|{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def file_identity(filepath):
+    """Returns the absolute path, size and modification time that tell a changed file apart, or None once it is gone.
+
+    The same details make up the cache key, so a file counts as changed exactly when its cache entry is stale.
+    """
+    try:
+        stat = os.stat(filepath)
+    except (OSError, TypeError):
+        return None
+    return os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns
+
+
+def file_sha256(filepath):
+    """Hashes a file's content a megabyte at a time, to recognise it whatever its name or modification time."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_json(path, data):
+    """Saves data as JSON, replacing the old file only once the new one is fully written."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def write_frame(data, path):
+    """Writes a DataFrame to path plus ".parquet", or ".pkl" when parquet cannot hold it, and returns the path written."""
+    # Parquet is preferred, but needs pyarrow and cannot hold columns of mixed types
+    try:
+        data.to_parquet(path + ".parquet", index=False)
+        return path + ".parquet"
+    except Exception:
+        if os.path.exists(path + ".parquet"):
+            os.remove(path + ".parquet")  # Left half written by the failed attempt
+        data.to_pickle(path + ".pkl")
+        return path + ".pkl"
+
+
+def read_frame(path, columns=None):
+    """Reads back a DataFrame saved by write_frame, only the given columns if any."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    data = pd.read_pickle(path)
+    return data if columns is None else data[columns]
+
+
+def _entry_paths(key):
+    return [os.path.join(CACHE_DIR, key + extension) for extension in CACHE_EXTENSIONS]
+
+
+def load_cached(filepath):
+    """Returns the cached DataFrame for an unchanged workbook, or None if it has not been cached."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        key = _cache_key(filepath)
+    except OSError:
+        return None
+
+    for entry_path in _entry_paths(key):
+        if not os.path.exists(entry_path):
+            continue
+        try:
+            data = read_frame(entry_path)
+            # Mark the entry as recently used for eviction
+            os.utime(entry_path)
+            return data
+        except Exception:
+            # A broken or half-evicted entry is treated as a miss
+            return None
+    return None
+
+
+def store_cached(filepath, data):
+    """Saves a parsed workbook to the cache, then trims the cache back under its size limit."""
+    if not CACHE_ENABLED:
+        return
+    try:
+        key = _cache_key(filepath)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    except OSError:
+        return
+
+    temp_path = os.path.join(CACHE_DIR, f"{key}.{os.getpid()}.tmp")
+    try:
+        written_path = write_frame(data, temp_path)
+        os.replace(written_path, os.path.join(CACHE_DIR, key + os.path.splitext(written_path)[1]))
+    except OSError:
+        for extension in CACHE_EXTENSIONS:
+            if os.path.exists(temp_path + extension):
+                os.remove(temp_path + extension)
+        return
+
+    evict_cache()
+
+
+def evict_cache(max_bytes=None):
+    """Removes the least recently used entries until the cache fits within max_bytes."""
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(CACHE_EXTENSIONS):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass  # Another process removed it first
+        total_bytes -= size
+
+
+def clear_cache():
+    """Removes every entry from the cache."""
+    evict_cache(max_bytes=0)
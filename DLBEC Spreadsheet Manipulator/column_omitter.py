@@ -1,31 +1,29 @@
-import ttkbootstrap as ttk
-from ttkbootstrap.dialogs import Messagebox
-import pandas as pd
-from tkinter import filedialog
-from tkinter import Listbox, EXTENDED
+import loader
+import tasks
+import writer
+import instrument
 import os
-from PIL import Image, ImageTk
-
-def load_excel_file():
-    """Prompts the user to select a single Excel file and loads it."""
-    filepath = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-    if not filepath:
-        Messagebox.show_error("No file selected!", "Error")
-        return None
-    try:
-        data = pd.read_excel(filepath, engine='openpyxl')
-        return filepath, data
-    except Exception as e:
-        Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
-        return None
-
-def omit_columns_from_file(filepath, data, columns_to_omit):
-    """Omit selected columns from the loaded file."""
-    data = data.drop(columns=columns_to_omit, errors='ignore')  # Drop columns
-    save_omitted_file(data, filepath)
-
-def save_omitted_file(data, original_filepath):
-    """Saves the modified file with omitted columns to a new file."""
+
+def omit_columns(data, columns_to_omit):
+    """Returns the data without the selected columns."""
+    return data.drop(columns=columns_to_omit, errors='ignore')  # Drop columns
+
+def omit_columns_from_workbook(filepath, columns_to_omit, save_path, progress=None, report=instrument.NO_REPORT):
+    """Copies a workbook row by row without the selected columns, never loading the omitted ones.
+
+    Returns the number of rows written.
+    """
+    columns_to_omit = set(columns_to_omit)
+    columns_to_keep = [col for col in loader.read_header(filepath) if col not in columns_to_omit]
+
+    # Loading, omitting and saving happen together as the rows stream through
+    with report.stage("omit and save", save_path) as record:
+        rows = loader.iter_rows(filepath, columns=columns_to_keep)
+        record["rows"] = rows_written = writer.write_rows(save_path, columns_to_keep, rows, progress=progress)
+    return rows_written
+
+def get_omitted_save_path(original_filepath, fmt=None):
+    """Returns the path in the 'Clean Files' folder that the trimmed file is saved to, in the chosen output format."""
     # Create a 'Clean Files' folder if it doesn't exist
     directory = os.path.dirname(original_filepath)
     clean_folder = os.path.join(directory, "Clean Files")
@@ -34,52 +32,34 @@ def save_omitted_file(data, original_filepath):
     # Generate the new filename by appending '_omitted_columns'
     filename = os.path.basename(original_filepath)
     new_filename = f"{os.path.splitext(filename)[0]}_omitted_columns.xlsx"
-    save_path = os.path.join(clean_folder, new_filename)
-    
-    # Save the modified data to the new file
-    try:
-        data.to_excel(save_path, index=False, engine='openpyxl')
-        Messagebox.show_info(f"File saved successfully: {save_path}", "Success")
-    except Exception as e:
-        Messagebox.show_error(f"Error saving file: {e}", "Error")
+    return writer.with_format(os.path.join(clean_folder, new_filename), fmt)
 
-def main():
-    app = ttk.Window(title="DLBEC Data Omitter", themename="darkly", size=(600, 450))
-    
-    # Set the window icon (make sure the .ico file is in the same directory)
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(script_dir, "app_icon.ico")
-    logo_path = os.path.join(script_dir, "logo.png")
-    app.iconbitmap(icon_path)
-    
-    # Load logo image and display in the window
-    try:
-        logo_image = Image.open(logo_path)  # Replace with your logo filename
-        logo_image = logo_image.resize((100, 100))
-        logo_photo = ImageTk.PhotoImage(logo_image)
-        logo_label = ttk.Label(app, image=logo_photo)
-        logo_label.image = logo_photo
-        logo_label.pack(pady=10)
-    except FileNotFoundError:
-        Messagebox.show_warning("Logo image not found!", "Warning")
+def build_ui(app, session=None):
+    """Builds the column omitter into a window or launcher tab, listing the columns of the shared session's workbooks if given."""
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    from tkinter import Listbox, EXTENDED
 
     # Create variables for data and selections
     filepath = None
-    data = None
     columns_to_omit = []
 
     def on_choose_file():
-        nonlocal filepath, data
+        nonlocal filepath
 
         # Load the selected Excel file
-        result = load_excel_file()
-        if not result:
+        chosen_filepath = tasks.choose_excel_file()
+        if not chosen_filepath:
             return
 
-        filepath, data = result
-
-        # Get column names from the loaded file
-        columns = data.columns.tolist()
+        # Only the header row is read to list the columns, unless the workbook is already loaded
+        loaded_data = session.get(chosen_filepath) if session else None
+        try:
+            columns = list(loaded_data.columns) if loaded_data is not None else loader.read_header(chosen_filepath)
+        except Exception as e:
+            Messagebox.show_error(f"Error loading file {chosen_filepath}: {e}", "Error")
+            return
+        filepath = chosen_filepath
         
         # Insert columns into the listbox
         column_listbox.delete(0, 'end')
@@ -90,9 +70,7 @@ def main():
         omit_button.config(state="normal")
     
     def on_omit_columns_and_save():
-        nonlocal filepath, data, columns_to_omit
-        
-        if filepath is None or data is None:
+        if filepath is None:
             Messagebox.show_error("No file loaded!", "Error")
             return
 
@@ -100,8 +78,20 @@ def main():
             Messagebox.show_error("No columns selected to omit!", "Error")
             return
 
-        # Omit the selected columns and save the new file
-        omit_columns_from_file(filepath, data, columns_to_omit)
+        # Omit the selected columns while copying the file row by row
+        save_path = get_omitted_save_path(filepath, format_combo.get())
+        source_filepath = filepath
+        selected = list(columns_to_omit)
+
+        def omit_and_save(task):
+            report = instrument.RunReport("omit")
+            # Always copied from the workbook's raw cells, so the file saves the same with or without the launcher
+            rows_written = omit_columns_from_workbook(source_filepath, selected, save_path, progress=task.report, report=report)
+            report.save(os.path.dirname(save_path))
+            return rows_written
+
+        task_panel.run(omit_and_save, lambda rows_written: Messagebox.show_info(f"File saved successfully: {save_path}", "Success"),
+                       "Omitting columns...", busy_widgets=[choose_file_button, omit_button, format_combo], error_message="Error saving file")
 
     def on_select_columns(event):
         """Handle the column selection event."""
@@ -149,13 +139,48 @@ def main():
     save_label = ttk.Label(save_frame, text="The file will be saved with omitted columns.", bootstyle="info")
     save_label.pack(pady=4, side="top")
 
+    # Output format of the trimmed file
+    format_combo = ttk.Combobox(save_frame, values=writer.FORMATS, state="readonly", width=8, bootstyle="dark")
+    format_combo.set(writer.DEFAULT_FORMAT)
+    format_combo.pack(pady=4)
+
     # Omit Columns and Save button
     omit_button = ttk.Button(save_frame, text="Omit Columns and Save", command=on_omit_columns_and_save, state="disabled", bootstyle="primary")
     omit_button.pack(pady=10, padx=10)
 
+    # Progress of the current load or save, with a Cancel button
+    task_panel = tasks.TaskPanel(app)
+    task_panel.pack(pady=10)
+
+
+def main():
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    from PIL import Image, ImageTk
+    app = ttk.Window(title="DLBEC Data Omitter", themename="darkly", size=(600, 550))
+    
+    # Set the window icon (make sure the .ico file is in the same directory)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    icon_path = os.path.join(script_dir, "app_icon.ico")
+    logo_path = os.path.join(script_dir, "logo.png")
+    app.iconbitmap(icon_path)
+    
+    # Load logo image and display in the window
+    try:
+        logo_image = Image.open(logo_path)  # Replace with your logo filename
+        logo_image = logo_image.resize((100, 100))
+        logo_photo = ImageTk.PhotoImage(logo_image)
+        logo_label = ttk.Label(app, image=logo_photo)
+        logo_label.image = logo_photo
+        logo_label.pack(pady=10)
+    except FileNotFoundError:
+        Messagebox.show_warning("Logo image not found!", "Warning")
+
+    build_ui(app)
+
     # Center the window on the screen
     window_width = 600
-    window_height = 450
+    window_height = 550
     screen_width = app.winfo_screenwidth()
     screen_height = app.winfo_screenheight()
     position_top = int(screen_height / 2 - window_height / 2)
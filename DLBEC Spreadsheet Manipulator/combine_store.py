@@ -0,0 +1,188 @@
+"""Keeps the combined data as a store that new workbooks are appended to, instead of recombining every file.
+
+The store is a folder holding one columnar part per source workbook and a manifest.json listing
+each source's path, SHA-256 hash, columns and rows. Updating it only reads the workbooks that are
+new or changed since they were added, and a new column simply widens the combined columns: older
+parts are aligned to it when the store is read. export() writes the whole store out as one file,
+in the same column order as the combiner, whenever a fresh xlsx (or csv/parquet) is needed.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import cache
+import combiner
+import instrument
+import loader
+import writer
+
+
+# Name of the store folder inside the 'Combined Files' folder
+STORE_FOLDER_NAME = "combined_store"
+
+MANIFEST_VERSION = 1
+
+
+def get_store_folder(filepath):
+    """Returns the store next to the given input file, in its 'Combined Files' folder."""
+    return os.path.join(os.path.dirname(os.path.abspath(filepath)), "Combined Files", STORE_FOLDER_NAME)
+
+
+class CombineStore:
+    """The sources combined so far, one part file each, in the order they were first added."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, "manifest.json")
+        self.manifest = {"version": MANIFEST_VERSION, "next_part": 0, "sources": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"{self.manifest_path} was written by a different version of the combiner.")
+            self.manifest = manifest
+
+    @property
+    def sources(self):
+        return self.manifest["sources"]
+
+    def get_columns(self):
+        """Returns the sorted union of the columns of every source, as combine_data uses."""
+        return sorted({column for source in self.sources.values() for column in source["columns"]})
+
+    def get_rows(self):
+        return sum(source["rows"] for source in self.sources.values())
+
+    def save_manifest(self):
+        """Saves the manifest, replacing the old one only once the new one is fully written."""
+        os.makedirs(self.folder, exist_ok=True)
+        cache.save_json(self.manifest_path, self.manifest)
+
+    def find_changes(self, filepaths):
+        """Returns (filepath, sha256) for the files that are new or have changed since they were added,
+        and a list of (filepath, error) pairs for the files that could not be read.
+
+        Files whose size and modification time match the manifest are not read at all; a file with
+        the same content as a source already in the store, e.g. a renamed copy, is left out too.
+        """
+        known_hashes = {source["sha256"] for source in self.sources.values()}
+        changes = []
+        errors = []
+        for filepath in filepaths:
+            # A file moved, deleted or locked since it was listed does not stop the others
+            try:
+                stat = os.stat(filepath)
+                source = self.sources.get(os.path.abspath(filepath))
+                if source and source["size"] == stat.st_size and source["mtime_ns"] == stat.st_mtime_ns:
+                    continue
+                sha256 = cache.file_sha256(filepath)
+            except OSError as e:
+                errors.append((filepath, e))
+                continue
+            if sha256 in known_hashes:
+                if source and source["sha256"] == sha256:
+                    # Touched but not changed
+                    source["size"], source["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+                continue
+            known_hashes.add(sha256)
+            changes.append((filepath, sha256))
+        return changes, errors
+
+    def add(self, filepath, data, sha256=None):
+        """Adds a loaded source to the store, replacing the part of an earlier version of the same file."""
+        key = os.path.abspath(filepath)
+        data = data.rename(columns=str)
+        os.makedirs(self.folder, exist_ok=True)
+        part_path = cache.write_frame(data, os.path.join(self.folder, f"part-{self.manifest['next_part']:05d}"))
+        self.manifest["next_part"] += 1
+
+        old_source = self.sources.get(key)
+        if old_source and old_source["part"] != os.path.basename(part_path):
+            old_part_path = os.path.join(self.folder, old_source["part"])
+            if os.path.exists(old_part_path):
+                os.remove(old_part_path)
+
+        stat = os.stat(filepath)
+        self.sources[key] = {
+            "sha256": sha256 or cache.file_sha256(filepath),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "part": os.path.basename(part_path),
+            "columns": list(data.columns),
+            "rows": len(data),
+            "added": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.save_manifest()
+
+    def update(self, filepaths, max_workers=None, progress=None, report=instrument.NO_REPORT):
+        """Loads and adds the files that are new or changed.
+
+        Returns the paths added and a list of (filepath, error) pairs for the files that failed to load.
+        progress, if given, is called as progress(done, total, message) after each file is loaded.
+        """
+        changes, errors = self.find_changes(filepaths)
+        hashes = dict(changes)
+        files_data, load_errors = loader.load_excel_files_parallel(list(hashes), max_workers=max_workers, progress=progress, report=report)
+        errors += load_errors
+        added = []
+        for filepath, data in files_data:
+            try:
+                with report.stage("store", filepath) as record:
+                    self.add(filepath, data, hashes[filepath])
+                    record["rows"] = len(data)
+            except OSError as e:
+                errors.append((filepath, e))  # Removed after it was loaded
+                continue
+            added.append(filepath)
+        # Unchanged files whose modification time moved are remembered, so they are not hashed again
+        self.save_manifest()
+        return added, errors
+
+    def iter_parts(self, columns=None):
+        """Yields every source's rows aligned to the combined columns, one source at a time."""
+        columns = columns or self.get_columns()
+        for source in self.sources.values():
+            yield combiner.align_columns(cache.read_frame(os.path.join(self.folder, source["part"])), columns)
+
+    def read(self):
+        """Returns the whole store as one DataFrame, as combine_data would build it from the sources."""
+        columns = self.get_columns()
+        frames = list(self.iter_parts(columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True, sort=False)
+
+    def _get_row_keys(self, dedup_columns):
+        """Returns the row keys of every part, reading only the key columns of each."""
+        chunk_keys = []
+        for source in self.sources.values():
+            key_columns = [column for column in dedup_columns if column in source["columns"]]
+            if not key_columns:
+                # No key at all, so none of its rows can be a duplicate
+                chunk_keys.append((np.zeros(source["rows"], dtype=np.uint64), np.zeros(source["rows"], dtype=bool)))
+                continue
+            part = cache.read_frame(os.path.join(self.folder, source["part"]), key_columns)
+            chunk_keys.append(combiner.get_row_keys(part, dedup_columns))
+        return chunk_keys
+
+    def export(self, save_path, dedup_columns=None, keep="first", progress=None):
+        """Writes the whole store to one file, a source at a time, and returns (rows written, duplicates removed).
+
+        With dedup_columns, duplicate rows are dropped as in combine_data.
+        """
+        columns = self.get_columns()
+        frames = self.iter_parts(columns)
+        total_rows = self.get_rows()
+        duplicates_removed = 0
+        if dedup_columns:
+            missing = [column for column in dedup_columns if column not in columns]
+            if missing:
+                raise ValueError(f"Column '{missing[0]}' not found in the dataset.")
+            masks, duplicates_removed = combiner.find_duplicates(self._get_row_keys(dedup_columns), keep)
+            frames = (df[mask] for df, mask in zip(frames, masks))
+            total_rows -= duplicates_removed
+        rows_written = writer.write_frames(save_path, columns, frames, total_rows=total_rows, progress=progress)
+        return rows_written, duplicates_removed
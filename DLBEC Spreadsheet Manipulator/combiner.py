@@ -1,97 +1,373 @@
+import numpy as np
 import pandas as pd
+import cache
+import loader
+import dnc_store
+import writer
+import tasks
+import instrument
 import os
-import ttkbootstrap as ttk
-from ttkbootstrap.dialogs import Messagebox
-from tkinter import filedialog
+import tempfile
 
 
-# Declare files_data in the global scope
-files_data = []
+# Memory the out-of-core combine aims to stay within (set DLBEC_COMBINE_MEMORY_MB to change it)
+COMBINE_MEMORY_LIMIT = int(os.environ.get("DLBEC_COMBINE_MEMORY_MB", 512)) * 1024 * 1024
 
+# Rough size of one parsed cell in memory, used to turn the memory limit into a chunk size
+BYTES_PER_CELL = 100
 
-def load_excel_files():
-    """Prompt the user to select multiple Excel files and load them."""
-    global files_data
-    filepaths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx")])
-    if not filepaths:
-        Messagebox.show_error("No files selected!", "Error")
-        return []
-    
-    files_data = []
-    for filepath in filepaths:
-        try:
-            data = pd.read_excel(filepath, engine='openpyxl')
-            files_data.append((filepath, data))
-        except Exception as e:
-            Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
-            continue
-    return files_data
-
-
-def combine_data(files_data):
-    """Combines all the data from the loaded files into a single DataFrame."""
-    if not files_data:
-        return None
+# Smallest chunk worth reading, however low the memory limit is set
+MIN_CHUNKSIZE = 1000
+
+# Key columns compared as normalized phone numbers, matched by their exact name (set DLBEC_PHONE_COLUMNS, comma separated)
+PHONE_COLUMNS = tuple(
+    column.strip() for column in os.environ.get("DLBEC_PHONE_COLUMNS", "First Number,Telephone Number").split(",") if column.strip()
+)
 
-    combined_data = pd.DataFrame()
+# Which copy of a duplicated row the dedup keeps
+KEEP_OPTIONS = ("first", "last")
 
-    # Determine all unique columns from all files
+# Folder the out-of-core combine spills its chunks to (set DLBEC_SPILL_DIR, defaults to the system temp folder)
+SPILL_DIR = os.environ.get("DLBEC_SPILL_DIR") or None
+
+
+def get_combined_columns(files_data):
+    """Returns the sorted union of the column names (as strings) across all loaded files."""
     all_columns = set()
     for _, df in files_data:
-        all_columns.update(df.columns)
+        all_columns.update(str(col) for col in df.columns)
+    return sorted(all_columns)
 
-    # Concatenate the files, ensuring columns match
-    for _, df in files_data:
-        # Add any missing columns to the dataframe
-        missing_columns = all_columns - set(df.columns)
-        for col in missing_columns:
-            df[col] = None  # Add missing columns with NaN values
 
-        # Reorder the columns to ensure consistency across all files
-        df.columns = [str(col) for col in df.columns]  # Convert all column names to strings
-        df = df[sorted(df.columns)]  # Sort the columns alphabetically
+def align_columns(df, columns):
+    """Returns the DataFrame with string column names, reindexed to the given columns.
+
+    The caller's DataFrame is left untouched; missing columns are filled with NaN.
+    """
+    return df.rename(columns=str).reindex(columns=columns)
+
+
+def is_phone_column(column, phone_columns=PHONE_COLUMNS):
+    return str(column) in phone_columns
+
+
+def get_key_text(values):
+    """Returns a key column as text, with whole-number floats written as integers.
+
+    A column of IDs read as floats because of a blank cell then matches the same IDs read as integers.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Convert each category once, then look it up by category code
+        categories = get_key_text(pd.Series(values.cat.categories)).astype(object).to_numpy()
+        return pd.Series(np.append(categories, pd.NA)[values.cat.codes.to_numpy()], index=values.index, dtype="string")
+    if pd.api.types.is_float_dtype(values.dtype):
+        whole = values.notna() & (values % 1 == 0) & (values.abs() < 2 ** 63)
+        text = values.astype("string")
+        text[whole] = values[whole].astype("int64").astype("string")
+        return text
+    if values.dtype == object:
+        values = pd.Series([int(value) if isinstance(value, float) and value.is_integer() else value for value in values],
+                           index=values.index, dtype=object)
+    return values.astype("string")
+
+
+def get_row_keys(df, key_columns, phone_columns=PHONE_COLUMNS):
+    """Returns a 64-bit hash of the normalized key columns of every row, and which rows have a key at all.
+
+    The phone_columns are compared as normalized numbers and other columns as upper case text without
+    spaces, so '07123 456789' / 'bs3 4ef' matches '+447123456789' / 'BS34EF'. Rows whose key columns
+    are all blank are never treated as duplicates.
+    """
+    df = df.rename(columns=str)
+    keys = {}
+    for column in key_columns:
+        values = df[column] if column in df.columns else pd.Series(pd.NA, index=df.index, dtype="string")
+        if is_phone_column(column, phone_columns):
+            keys[column] = dnc_store.normalize_phone_numbers(values)
+        else:
+            text = get_key_text(values).str.upper().str.replace(r"\s+", "", regex=True)
+            keys[column] = text.mask(text == "")
+    keys = pd.DataFrame(keys, index=df.index)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return hashes, keys.notna().any(axis=1).to_numpy()
+
+
+class DuplicateIndex:
+    """The row keys seen so far, kept in a hash set so every chunk is checked in one pass over its own rows.
+
+    Chunks are added in order; keep_mask returns which of a chunk's rows were not seen before.
+    """
 
-        # Append the data from this file to the combined DataFrame
-        combined_data = pd.concat([combined_data, df], ignore_index=True, sort=False)
+    def __init__(self):
+        self.seen = set()
+        self.duplicates_removed = 0
+
+    def keep_mask(self, hashes, valid):
+        keep = np.ones(len(hashes), dtype=bool)
+        seen = self.seen
+        # Each key is looked up and added once, so repeats within the chunk are caught too
+        for position in np.flatnonzero(valid).tolist():
+            key = int(hashes[position])
+            if key in seen:
+                keep[position] = False
+            else:
+                seen.add(key)
+        self.duplicates_removed += int((~keep).sum())
+        return keep
+
+
+def find_duplicates(chunk_keys, keep="first"):
+    """Returns a keep mask for every chunk's (hashes, valid) keys and the number of duplicates removed.
+
+    keep="first" keeps the earliest copy of each row; keep="last" walks the chunks backwards to keep the latest.
+    """
+    if keep not in KEEP_OPTIONS:
+        raise ValueError(f"keep must be one of: {', '.join(KEEP_OPTIONS)}.")
+    index = DuplicateIndex()
+    if keep == "first":
+        masks = [index.keep_mask(hashes, valid) for hashes, valid in chunk_keys]
+    else:
+        masks = [index.keep_mask(hashes[::-1], valid[::-1])[::-1] for hashes, valid in reversed(chunk_keys)][::-1]
+    return masks, index.duplicates_removed
+
+
+def check_dedup_columns(files_data, dedup_columns):
+    """Raises a ValueError if a key column is not in any of the files."""
+    all_columns = get_combined_columns(files_data)
+    missing = [column for column in dedup_columns if column not in all_columns]
+    if missing:
+        raise ValueError(f"Column '{missing[0]}' not found in the dataset.")
+
+
+def combine_data(files_data, dedup_columns=None, keep="first"):
+    """Combines all the data from the loaded files into a single DataFrame.
+
+    With dedup_columns, rows whose key columns match an earlier (or, with keep="last", a later) row
+    are dropped; the number removed is in combined_data.attrs["duplicates_removed"].
+    """
+    if not files_data:
+        return None
+
+    # Determine all unique columns from all files once, sorted alphabetically
+    all_columns = get_combined_columns(files_data)
+
+    # Align every file to the same columns and concatenate them in a single pass
+    aligned = [align_columns(df, all_columns) for _, df in files_data]
+    duplicates_removed = 0
+    if dedup_columns:
+        check_dedup_columns(files_data, dedup_columns)
+        masks, duplicates_removed = find_duplicates([get_row_keys(df, dedup_columns) for df in aligned], keep)
+        aligned = [df[mask] for df, mask in zip(aligned, masks)]
+    combined_data = pd.concat(aligned, ignore_index=True, sort=False)
+    combined_data.attrs["duplicates_removed"] = duplicates_removed
 
     return combined_data
 
 
-def save_combined_data(combined_data):
-    """Saves the combined data to a new Excel file."""
-    if combined_data is None or combined_data.empty:
-        Messagebox.show_error("No data to save.", "Error")
-        return
+def get_combined_save_path(files_data, fmt=None):
+    """Returns the path of the combined file in the chosen output format, creating the 'Combined Files' folder if needed."""
+    return get_combined_save_path_for_file(files_data[0][0], fmt)  # Next to the first file
 
-    # Get the directory for saving the combined file
-    directory = os.path.dirname(files_data[0][0])  # Directory of the first file
+
+def get_combined_save_path_for_file(filepath, fmt=None):
+    """Returns the path of the combined file next to the given input file."""
+    directory = os.path.dirname(filepath)
     save_folder = os.path.join(directory, "Combined Files")
     os.makedirs(save_folder, exist_ok=True)
+    return writer.with_format(os.path.join(save_folder, "combined_data.xlsx"), fmt)
 
-    # Create the filename
-    save_path = os.path.join(save_folder, "combined_data.xlsx")
-    
+
+def write_combined_files(files_data, save_path, progress=None, dedup_columns=None, keep="first"):
+    """Streams the aligned files into one output file and returns the number of rows written.
+
+    With dedup_columns, duplicate rows are dropped as in combine_data.
+    """
+    all_columns = get_combined_columns(files_data)
+    frames = (align_columns(df, all_columns) for _, df in files_data)
+    total_rows = sum(len(df) for _, df in files_data)
+    if dedup_columns:
+        # The keys are hashed up front so keep="last" knows about later files before anything is written
+        check_dedup_columns(files_data, dedup_columns)
+        masks, duplicates_removed = find_duplicates([get_row_keys(df, dedup_columns) for _, df in files_data], keep)
+        frames = (df[mask] for df, mask in zip(frames, masks))
+        total_rows -= duplicates_removed
+    return writer.write_frames(save_path, all_columns, frames, total_rows=total_rows, progress=progress)
+
+
+def get_chunksize(n_columns, memory_limit):
+    """Returns how many rows of a sheet with n_columns fit within the memory limit."""
+    return max(MIN_CHUNKSIZE, memory_limit // (max(n_columns, 1) * BYTES_PER_CELL))
+
+
+def _count_columns(filepath):
+    # A file that cannot be read is reported when it is spilled
     try:
-        combined_data.to_excel(save_path, index=False, engine='openpyxl')
-        Messagebox.show_info(f"Combined data saved successfully to {save_path}", "Success")
-    except Exception as e:
-        Messagebox.show_error(f"Error saving combined data: {e}", "Error")
+        return len(loader.read_header(filepath))
+    except Exception:
+        return 0
 
 
-def main():
-    global files_data  # Ensure it's referenced as global in the main function
-    app = ttk.Window(title="DLBEC Data Combiner", themename="darkly", size=(600, 400))
+def _spill_file(filepath, spill_folder, file_number, chunksize, dedup_columns=None):
+    """Streams one workbook into numbered chunk files, returning (spill path, columns, rows, keys) for each chunk.
+
+    The chunks are first spilled as read, then typed once the whole file has been seen, so a value
+    late in the file decides the type of its column in every chunk, as when the file is loaded whole.
+    keys holds the chunk's row keys when dedup_columns is given, so only they come back from the worker.
+    """
+    raw_paths = []
+    dtypes = None
+    for chunk_number, chunk in enumerate(loader.iter_excel_chunks(filepath, chunksize, convert=False)):
+        chunk = chunk.rename(columns=str)
+        dtypes = loader.merge_numeric_dtypes(dtypes, loader.get_numeric_dtypes(chunk))
+        # Pickled, as only pickle keeps the raw cells exactly as read
+        raw_path = os.path.join(spill_folder, f"{file_number:05d}-{chunk_number:05d}.raw.pkl")
+        chunk.to_pickle(raw_path)
+        raw_paths.append(raw_path)
+
+    spilled = []
+    for chunk_number, raw_path in enumerate(raw_paths):
+        chunk = loader.convert_numeric(pd.read_pickle(raw_path), dtypes)
+        os.remove(raw_path)
+        spill_path = cache.write_frame(chunk, os.path.join(spill_folder, f"{file_number:05d}-{chunk_number:05d}"))
+        keys = get_row_keys(chunk, dedup_columns) if dedup_columns else None
+        spilled.append((spill_path, list(chunk.columns), len(chunk), keys))
+    return spilled
+
+
+def combine_files_out_of_core(filepaths, save_path, memory_limit=None, max_workers=None, progress=None, report=instrument.NO_REPORT,
+                              dedup_columns=None, keep="first"):
+    """Combines workbooks that together do not fit in memory.
+
+    Each file is read a chunk at a time and spilled to a temporary folder, then the chunks are
+    aligned to the union of the columns and streamed into the output file. Only a few chunks are
+    held in memory at once, sized from memory_limit (bytes). With dedup_columns, duplicate rows
+    are dropped as in combine_data, using only the 8-byte row keys kept in memory.
+
+    Returns the number of rows written, the number of duplicates removed and a list of
+    (filepath, error) pairs for the files that could not be read.
+    """
+    if memory_limit is None:
+        memory_limit = COMBINE_MEMORY_LIMIT
+    workers = 1 if max_workers == 1 or len(filepaths) <= 1 else (max_workers or os.cpu_count() or 1)
+
+    # Every worker holds one chunk while the writer holds another
+    n_columns = max((_count_columns(filepath) for filepath in filepaths), default=1)
+    chunksize = get_chunksize(n_columns, memory_limit // (workers + 1))
+
+    with tempfile.TemporaryDirectory(prefix="dlbec-combine-", dir=SPILL_DIR) as spill_folder:
+        jobs = [(filepath, (filepath, spill_folder, file_number, chunksize, dedup_columns)) for file_number, filepath in enumerate(filepaths)]
+        results = loader.run_parallel(_spill_file, jobs, max_workers=workers, progress=progress, report=report, stage="spill",
+                                      message="Read {name}", rows=lambda spilled: sum(rows for _, _, rows, _ in spilled))
+        spilled_files = [spilled for _, spilled, error in results if error is None]
+        errors = [(filepath, error) for filepath, _, error in results if error is not None]
+
+        # The columns are only known once every chunk has been read, as rows can be wider than the header
+        chunks = [chunk for spilled in spilled_files for chunk in spilled]
+        all_columns = sorted({col for _, columns, _, _ in chunks for col in columns})
+        missing = [column for column in dedup_columns or () if column not in all_columns]
+        if missing:
+            raise ValueError(f"Column '{missing[0]}' not found in the dataset.")
+        total_rows = sum(rows for _, _, rows, _ in chunks)
+        frames = (align_columns(cache.read_frame(spill_path), all_columns) for spill_path, _, _, _ in chunks)
+
+        duplicates_removed = 0
+        if dedup_columns:
+            masks, duplicates_removed = find_duplicates([keys for _, _, _, keys in chunks], keep)
+            frames = (df[mask] for df, mask in zip(frames, masks))
+            total_rows -= duplicates_removed
+
+        with report.stage("save", save_path) as record:
+            rows_written = record["rows"] = writer.write_frames(save_path, all_columns, frames, total_rows=total_rows, progress=progress)
+    return rows_written, duplicates_removed, errors
+
+
+def build_ui(app, session=None):
+    """Builds the combiner into a window or launcher tab, loading through the shared session if given."""
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    load_files = session.load if session else loader.load_excel_files_parallel
+
+    files_data = []
+    run_report = instrument.NO_REPORT  # Timings of the loaded files, saved with the combined file when DLBEC_PROFILE is set
     
     # Load button
     def on_load_files():
-        files_data = load_excel_files()  # No need for nonlocal, as files_data is now global
-        if files_data:
-            combine_button.config(state="normal")  # Enable the combine button after files are loaded
+        filepaths = tasks.choose_excel_files()
+        if not filepaths:
+            return
+
+        report = instrument.RunReport("combine")
+
+        def load(task):
+            # Load the files in parallel; a file that fails does not stop the others
+            return load_files(filepaths, progress=task.report, report=report)
+
+        def loaded(result):
+            nonlocal files_data, run_report
+            files_data, errors = result
+            run_report = report
+            for filepath, e in errors:
+                Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
+            if files_data:
+                combine_button.config(state="normal")  # Enable the combine button after files are loaded
+
+        task_panel.run(load, loaded, "Loading files...", busy_widgets=all_widgets)
     
     # Combine and Save button
     def on_combine_and_save():
-        combined_data = combine_data(files_data)
-        save_combined_data(combined_data)
+        if not files_data or all(df.empty for _, df in files_data):
+            Messagebox.show_error("No data to save.", "Error")
+            return
+        save_path = get_combined_save_path(files_data, format_combo.get())
+        dedup_columns, keep = get_dedup_choice()
+
+        def combine_and_save(task):
+            # Stream the files straight into the combined file without building the combined DataFrame
+            with run_report.stage("combine and save", save_path) as record:
+                rows_written = record["rows"] = write_combined_files(files_data, save_path, progress=task.report,
+                                                                     dedup_columns=dedup_columns, keep=keep)
+            run_report.save(os.path.dirname(save_path))
+            return rows_written
+
+        def saved(rows_written):
+            message = f"Combined data saved successfully to {save_path}"
+            if dedup_columns:
+                message += f"\n{sum(len(df) for _, df in files_data) - rows_written} duplicate rows removed."
+            Messagebox.show_info(message, "Success")
+
+        task_panel.run(combine_and_save, saved, "Combining files...", busy_widgets=all_widgets)
+
+    # Combine Large Files button
+    def on_combine_large_files():
+        filepaths = tasks.choose_excel_files()
+        if not filepaths:
+            return
+        save_path = get_combined_save_path_for_file(filepaths[0], format_combo.get())
+        dedup_columns, keep = get_dedup_choice()
+
+        def combine_large(task):
+            # The files are never loaded whole, so this works for inputs larger than memory
+            report = instrument.RunReport("combine")
+            result = combine_files_out_of_core(filepaths, save_path, progress=task.report, report=report,
+                                               dedup_columns=dedup_columns, keep=keep)
+            report.save(os.path.dirname(save_path))
+            return result
+
+        def saved(result):
+            rows_written, duplicates_removed, errors = result
+            for filepath, e in errors:
+                Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
+            message = f"{rows_written} rows combined and saved to {save_path}"
+            if dedup_columns:
+                message += f"\n{duplicates_removed} duplicate rows removed."
+            Messagebox.show_info(message, "Success")
+
+        task_panel.run(combine_large, saved, "Combining large files...", busy_widgets=all_widgets)
+
+    def get_dedup_choice():
+        """Returns the key columns typed in (comma separated, none to keep every row) and which copy to keep."""
+        dedup_columns = [column.strip() for column in dedup_entry.get().split(",") if column.strip()]
+        return dedup_columns, keep_combo.get()
 
     # Set up the button frame
     button_frame = ttk.Frame(app)
@@ -109,9 +385,41 @@ def main():
     combine_button = ttk.Button(button_frame, text="Combine and Save", command=on_combine_and_save, state="disabled", bootstyle="primary")
     combine_button.pack(pady=10, padx=10)
 
+    # Combine Large Files button, for inputs that do not fit in memory
+    large_button = ttk.Button(button_frame, text="Combine Large Files", command=on_combine_large_files, bootstyle="warning")
+    large_button.pack(pady=4, padx=10)
+
+    # Output format of the combined file
+    format_combo = ttk.Combobox(button_frame, values=writer.FORMATS, state="readonly", width=8, bootstyle="dark")
+    format_combo.set(writer.DEFAULT_FORMAT)
+    format_combo.pack(pady=4)
+
+    # Optional deduplication on the columns typed in
+    dedup_frame = ttk.Frame(app)
+    dedup_frame.pack(pady=4)
+    dedup_label = ttk.Label(dedup_frame, text="Remove duplicates by columns (comma separated):", bootstyle="info")
+    dedup_label.pack(pady=4, side="top")
+    dedup_entry = ttk.Entry(dedup_frame, bootstyle="dark")
+    dedup_entry.pack(padx=5, side="left")
+    keep_combo = ttk.Combobox(dedup_frame, values=KEEP_OPTIONS, state="readonly", width=6, bootstyle="dark")
+    keep_combo.set("first")
+    keep_combo.pack(padx=5, side="left")
+
+    all_widgets = [choose_file_button, combine_button, large_button, format_combo, dedup_entry, keep_combo]
+
+    # Progress of the current load or save, with a Cancel button
+    task_panel = tasks.TaskPanel(app)
+    task_panel.pack(pady=10)
+
+
+def main():
+    import ttkbootstrap as ttk
+    app = ttk.Window(title="DLBEC Data Combiner", themename="darkly", size=(600, 550))
+    build_ui(app)
+
     # Center the window on the screen
     window_width = 600
-    window_height = 400
+    window_height = 550
     screen_width = app.winfo_screenwidth()
     screen_height = app.winfo_screenheight()
     position_top = int(screen_height / 2 - window_height / 2)
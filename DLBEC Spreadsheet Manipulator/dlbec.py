@@ -0,0 +1,312 @@
+"""Command-line entry point for the DLBEC tools, for scripted and scheduled runs.
+
+    python dlbec.py combine FILE [FILE ...] [--dedup COLUMN ...] [--out-of-core [--memory-mb N] | --incremental [--store DIR]]
+    python dlbec.py extract FILE [FILE ...] --column Postcode (--prefix 'B, BS, CV1-CV9' | --split | --stats)
+    python dlbec.py dnc [MAIN ...] [--folder DIR] [--dnc-sheet SHEET] [--add SHEET]
+    python dlbec.py omit FILE --columns NAME [NAME ...]
+    python dlbec.py pipeline SPEC.json
+    python dlbec.py watch FOLDER --op combine|suppress|split [--interval SECONDS] [--once]
+
+Every command takes --format xlsx|csv|parquet to choose the output format, and --profile
+(or DLBEC_PROFILE=1) to save a JSON report of the time and memory each stage took next to the output.
+The GUI stack is never imported, and pandas is only imported once a command runs.
+"""
+import argparse
+import os
+import sys
+
+
+def get_report(args, tool):
+    import instrument
+    return instrument.RunReport(tool, enabled=True if args.profile else None)
+
+
+def save_report(report, folder):
+    report_path = report.save(folder)
+    if report_path:
+        print(f"Report saved as {report_path}")
+
+
+def run_combine(args):
+    import combiner
+    import loader
+
+    report = get_report(args, "combine")
+    if args.incremental:
+        return run_incremental_combine(args, report)
+    if args.out_of_core:
+        memory_limit = args.memory_mb * 1024 * 1024 if args.memory_mb else None
+        save_path = args.output or combiner.get_combined_save_path_for_file(args.files[0], args.format)
+        rows_written, duplicates_removed, errors = combiner.combine_files_out_of_core(
+            args.files, save_path, memory_limit=memory_limit, max_workers=args.workers, report=report, dedup_columns=args.dedup, keep=args.keep)
+        for filepath, e in errors:
+            print(f"Error loading file {filepath}: {e}", file=sys.stderr)
+        print(f"Combined {rows_written} rows from {len(args.files) - len(errors)} files into {save_path}")
+        if args.dedup:
+            print(f"{duplicates_removed} duplicate rows removed")
+        save_report(report, os.path.dirname(os.path.abspath(save_path)))
+        return 1 if errors else 0
+
+    files_data, errors = loader.load_excel_files_parallel(args.files, max_workers=args.workers, report=report)
+    for filepath, e in errors:
+        print(f"Error loading file {filepath}: {e}", file=sys.stderr)
+    if not files_data or all(df.empty for _, df in files_data):
+        print("No data to save.", file=sys.stderr)
+        return 1
+
+    save_path = args.output or combiner.get_combined_save_path(files_data, args.format)
+    with report.stage("combine and save", save_path) as record:
+        rows_written = record["rows"] = combiner.write_combined_files(files_data, save_path, dedup_columns=args.dedup, keep=args.keep)
+    print(f"Combined {rows_written} rows from {len(files_data)} files into {save_path}")
+    if args.dedup:
+        print(f"{sum(len(df) for _, df in files_data) - rows_written} duplicate rows removed")
+    save_report(report, os.path.dirname(os.path.abspath(save_path)))
+    return 1 if errors else 0
+
+
+def run_incremental_combine(args, report):
+    import combine_store
+    import combiner
+
+    store = combine_store.CombineStore(args.store or combine_store.get_store_folder(args.files[0]))
+    added, errors = store.update(args.files, max_workers=args.workers, report=report)
+    for filepath, e in errors:
+        print(f"Error loading file {filepath}: {e}", file=sys.stderr)
+    print(f"Added {len(added)} new or changed files to {store.folder} ({len(store.sources)} files, {store.get_rows()} rows)")
+    if args.no_export:
+        return 1 if errors else 0
+    if not store.get_rows():
+        print("No data to save.", file=sys.stderr)
+        return 1
+
+    save_path = args.output or combiner.get_combined_save_path_for_file(args.files[0], args.format)
+    with report.stage("export", save_path) as record:
+        rows_written, duplicates_removed = store.export(save_path, args.dedup, args.keep)
+        record["rows"] = rows_written
+    print(f"Exported {rows_written} rows into {save_path}")
+    if args.dedup:
+        print(f"{duplicates_removed} duplicate rows removed")
+    save_report(report, os.path.dirname(os.path.abspath(save_path)))
+    return 1 if errors else 0
+
+
+def run_extract(args):
+    import extractor
+    import loader
+    import postcode
+
+    if args.prefix:
+        try:
+            postcode.parse_prefix_spec(args.prefix)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    report = get_report(args, "extract")
+    files_data, errors = loader.load_excel_files_parallel(args.files, max_workers=args.workers, report=report)
+    for filepath, e in errors:
+        print(f"Error loading file {filepath}: {e}", file=sys.stderr)
+
+    if args.stats:
+        # Only print how many rows each prefix would extract, without writing anything
+        try:
+            stats, missing = extractor.get_prefix_stats(files_data, args.column)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        for filepath in missing:
+            print(f"Column '{args.column}' not found in file {filepath}!", file=sys.stderr)
+        for prefix, rows in stats.items():
+            print(f"{prefix:<4} {rows}")
+        return 1 if errors or missing else 0
+
+    for filepath, data in files_data:
+        if args.column not in data.columns:
+            print(f"Column '{args.column}' not found in file {filepath}!", file=sys.stderr)
+            errors.append((filepath, None))
+            continue
+
+        if args.split:
+            with report.stage("partition", filepath) as record:
+                partitions = extractor.partition_by_postcode(data, args.column)
+                record["rows"] = len(data)
+            with report.stage("save", filepath) as record:
+                save_paths, save_errors = extractor.save_partitions(partitions, filepath, max_workers=args.workers, fmt=args.format)
+                record["rows"] = len(data)
+            for prefix, e in save_errors:
+                print(f"Error saving {prefix} postcodes from {filepath}: {e}", file=sys.stderr)
+            errors.extend(save_errors)
+        else:
+            filtered_data = report.run("filter", filepath, extractor.filter_by_postcode, data, args.column, args.prefix)
+            if filtered_data.empty:
+                print(f"No matching entries found in file {filepath}!", file=sys.stderr)
+                continue
+            save_path = extractor.get_filtered_save_path(filtered_data, filepath, args.prefix, args.format)
+            with report.stage("save", save_path) as record:
+                save_paths = [extractor.write_filtered_data(filtered_data, save_path)]
+                record["rows"] = len(filtered_data)
+
+        for save_path in save_paths:
+            print(f"Saved {save_path}")
+    if files_data:
+        save_report(report, os.path.join(os.path.dirname(os.path.abspath(files_data[0][0])), "Clean Files"))
+    return 1 if errors else 0
+
+
+def run_dnc(args):
+    import dnc_remover
+    import dnc_store
+    import loader
+
+    report = get_report(args, "dnc")
+    if args.add:
+        dnc_numbers, numbers_added = report.run("add dnc", args.add, dnc_store.update_dnc_store, args.add)
+        print(f"{numbers_added} new numbers added; the saved DNC list now holds {len(dnc_numbers)} numbers.")
+    if not args.main_sheets and not args.folder:
+        if args.add:
+            save_report(report, os.path.dirname(os.path.abspath(args.add)))
+        return 0
+
+    # The DNC list is loaded once for every sheet
+    if args.dnc_sheet:
+        dnc_numbers = report.run("load dnc", args.dnc_sheet, dnc_store.read_dnc_numbers, args.dnc_sheet)
+    else:
+        dnc_numbers = report.run("load dnc", dnc_store.DNC_STORE_PATH, dnc_store.load_dnc_store)
+    if not len(dnc_numbers):
+        print("The DNC list is empty!", file=sys.stderr)
+        return 1
+
+    failed = 0
+    for main_filepath in args.main_sheets:
+        try:
+            main_data = report.run("load", main_filepath, loader.read_excel, main_filepath, False)
+            entries_removed, new_filename = dnc_remover.suppress_main_sheet(main_filepath, main_data, dnc_numbers, args.format, report=report)
+        except Exception as e:
+            print(f"Error processing {main_filepath}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{os.path.basename(main_filepath)}: {entries_removed} entries removed" + (f", saved as {new_filename}" if new_filename else ""))
+
+    if args.folder:
+        summary = dnc_remover.suppress_folder(args.folder, dnc_numbers, max_workers=args.workers, fmt=args.format, report=report)
+        for row in summary:
+            if row["Error"]:
+                print(f"Error processing {row['File']}: {row['Error']}", file=sys.stderr)
+                failed += 1
+            else:
+                print(f"{row['File']}: {row['Entries Removed']} entries removed")
+        if summary:
+            print(f"Summary saved as {dnc_remover.save_suppression_summary(summary, args.folder)}")
+    save_report(report, args.folder or os.path.dirname(os.path.abspath(args.main_sheets[0])))
+    return 1 if failed else 0
+
+
+def run_omit(args):
+    import column_omitter
+
+    report = get_report(args, "omit")
+    save_path = args.output or column_omitter.get_omitted_save_path(args.file, args.format)
+    rows_written = column_omitter.omit_columns_from_workbook(args.file, args.columns, save_path, report=report)
+    print(f"File saved successfully: {save_path} ({rows_written} rows)")
+    save_report(report, os.path.dirname(os.path.abspath(save_path)))
+    return 0
+
+
+def run_pipeline(args):
+    import pipeline
+
+    spec = pipeline.load_spec(args.spec)
+    if args.format:
+        spec["format"] = args.format
+    save_paths, errors = pipeline.run_pipeline(spec, report=get_report(args, "pipeline"))
+    for filepath, e in errors:
+        print(f"Error loading file {filepath}: {e}", file=sys.stderr)
+    for save_path in save_paths:
+        print(f"Saved {save_path}")
+    return 1 if errors else 0
+
+
+def run_watch(args):
+    import watch
+
+    watcher = watch.FolderWatcher(args.folder, args.op, fmt=args.format, column=args.column, dnc_sheet=args.dnc_sheet,
+                                  dedup_columns=args.dedup, keep=args.keep)
+    try:
+        ok = watcher.run(interval=args.interval, once=args.once, profile=True if args.profile else None)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+        return 0
+    return 0 if ok else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="dlbec", description="DLBEC Spreadsheet Manipulator tools without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Options shared by every command; the choices mirror writer.FORMATS without importing it up front
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=("xlsx", "csv", "parquet"),
+                        help="Output format (default: DLBEC_OUTPUT_FORMAT or xlsx).")
+    common.add_argument("--profile", action="store_true", help="Save a JSON report of the time and memory each stage took.")
+
+    combine_parser = subparsers.add_parser("combine", parents=[common], help="Combine several workbooks into one.")
+    combine_parser.add_argument("files", nargs="+", help="Workbooks to combine.")
+    combine_parser.add_argument("--output", help="Path of the combined file; its extension picks the format (default: 'Combined Files/combined_data.<format>').")
+    combine_parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    combine_parser.add_argument("--dedup", nargs="+", metavar="COLUMN", help="Drop rows whose values in these columns match another row.")
+    combine_parser.add_argument("--keep", choices=("first", "last"), default="first", help="Which copy of a duplicated row to keep (default: first).")
+    combine_parser.add_argument("--out-of-core", action="store_true", help="Read the files a chunk at a time for inputs larger than memory.")
+    combine_parser.add_argument("--memory-mb", type=int, help="Memory limit for --out-of-core (default: DLBEC_COMBINE_MEMORY_MB or 512).")
+    combine_parser.add_argument("--incremental", action="store_true", help="Only read the files that are new or changed since the last run, keeping the rest in a combine store.")
+    combine_parser.add_argument("--store", help="Combine store folder for --incremental (default: 'Combined Files/combined_store').")
+    combine_parser.add_argument("--no-export", action="store_true", help="With --incremental, only update the store and leave the combined file as it is.")
+    combine_parser.set_defaults(handler=run_combine)
+
+    extract_parser = subparsers.add_parser("extract", parents=[common], help="Extract rows by postcode prefix.")
+    extract_parser.add_argument("files", nargs="+", help="Workbooks to extract from.")
+    extract_parser.add_argument("--column", required=True, help="Column holding the postcodes.")
+    mode = extract_parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--prefix", help="Postcode prefixes to extract, e.g. 'B, BS, CV1-CV9' (areas, outward codes and district ranges).")
+    mode.add_argument("--split", action="store_true", help="Write one workbook per postcode prefix.")
+    mode.add_argument("--stats", action="store_true", help="Only print the number of rows for every postcode prefix.")
+    extract_parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    extract_parser.set_defaults(handler=run_extract)
+
+    dnc_parser = subparsers.add_parser("dnc", parents=[common], help="Remove DNC numbers from main sheets.")
+    dnc_parser.add_argument("main_sheets", nargs="*", help="Main sheets named with an '(n).xlsx' entry count.")
+    dnc_parser.add_argument("--folder", help="Suppress every main sheet in this folder.")
+    dnc_parser.add_argument("--dnc-sheet", help="DNC sheet to use instead of the saved DNC list.")
+    dnc_parser.add_argument("--add", metavar="SHEET", help="Add a DNC sheet to the saved DNC list first.")
+    dnc_parser.add_argument("--workers", type=int, help="Number of worker processes for --folder.")
+    dnc_parser.set_defaults(handler=run_dnc)
+
+    omit_parser = subparsers.add_parser("omit", parents=[common], help="Remove columns from a workbook.")
+    omit_parser.add_argument("file", help="Workbook to trim.")
+    omit_parser.add_argument("--columns", nargs="+", required=True, help="Columns to omit.")
+    omit_parser.add_argument("--output", help="Path of the trimmed file; its extension picks the format (default: 'Clean Files/<name>_omitted_columns.<format>').")
+    omit_parser.set_defaults(handler=run_omit)
+
+    pipeline_parser = subparsers.add_parser("pipeline", parents=[common], help="Run several steps in memory from a JSON spec.")
+    pipeline_parser.add_argument("spec", help="Pipeline spec file (see pipeline.py).")
+    pipeline_parser.set_defaults(handler=run_pipeline)
+
+    watch_parser = subparsers.add_parser("watch", parents=[common], help="Process every new workbook dropped into a folder.")
+    watch_parser.add_argument("folder", help="Drop folder to watch.")
+    watch_parser.add_argument("--op", choices=("combine", "suppress", "split"), required=True, help="Operation to run on the new workbooks.")
+    watch_parser.add_argument("--interval", type=float, help="Seconds between looks at the folder (default: DLBEC_WATCH_INTERVAL or 10).")
+    watch_parser.add_argument("--once", action="store_true", help="Process what is new and exit, e.g. from a scheduled task.")
+    watch_parser.add_argument("--column", default="Postcode", help="Column holding the postcodes for split (default: Postcode).")
+    watch_parser.add_argument("--dnc-sheet", help="DNC sheet for suppress instead of the saved DNC list.")
+    watch_parser.add_argument("--dedup", nargs="+", metavar="COLUMN", help="Drop duplicate rows when combining, as in combine.")
+    watch_parser.add_argument("--keep", choices=("first", "last"), default="first", help="Which copy of a duplicated row to keep (default: first).")
+    watch_parser.set_defaults(handler=run_watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,88 +1,221 @@
 import os
+import re
 import pandas as pd
-from tkinter import filedialog, Tk
-import ttkbootstrap as ttk
-from ttkbootstrap.dialogs import Messagebox
-
-def load_excel_file():
-    """Prompts the user to select an Excel file and loads it."""
-    filepath = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-    if not filepath:
-        Messagebox.show_error("No file selected!", "Error")
-        return None
-    try:
-        data = pd.read_excel(filepath, engine='openpyxl')
-        return filepath, data
-    except Exception as e:
-        Messagebox.show_error(f"Error loading file: {e}", "Error")
-        return None, None
-
-def get_phone_column(df, column_name):
-    """Extracts and returns the phone number column from the DataFrame."""
-    if column_name not in df.columns:
-        raise ValueError(f"Column '{column_name}' not found in the dataset.")
-    return df[column_name].astype(str)
+import loader
+import dnc_store
+import instrument
+import tasks
+import writer
+
+def remove_dnc_numbers(main_data, dnc_numbers):
+    """Removes entries from the main sheet whose first number is in the sorted array of DNC numbers."""
+    filtered_data = main_data[~dnc_store.is_dnc_number(main_data["First Number"], dnc_numbers)]
+    return filtered_data
 
 def remove_dnc_entries(main_data, dnc_data):
     """Removes entries from the main sheet based on DNC data's phone numbers."""
-    dnc_phone_numbers = set(dnc_data["Telephone Number"].astype(str))
-    filtered_data = main_data[~main_data["First Number"].astype(str).isin(dnc_phone_numbers)]
-    return filtered_data
+    dnc_numbers = dnc_store.build_dnc_numbers(dnc_data["Telephone Number"])
+    return remove_dnc_numbers(main_data, dnc_numbers)
 
-def main():
-    app = Tk()
-    app.title("DLBEC Objection Remover")
-    app.geometry("600x400")
-    app.iconbitmap("app_icon.ico")  # Set app icon
+def suppress_main_sheet(main_filepath, main_data, dnc_numbers, fmt=None, report=instrument.NO_REPORT):
+    """Removes the DNC numbers from a main sheet and saves it under its new entry count, in the chosen output format.
 
-    # Apply the ttkbootstrap theme correctly
-    app.tk_setPalette(background='#1E1E1E')  # Sets dark background
-    style = ttk.Style("darkly")
-    
+    The original file is deleted once the filtered one is saved; a ValueError is raised, leaving it
+    untouched, if a file with the new name already exists. Returns the number of entries removed
+    and the new filename (None when nothing was removed).
+    """
+    with report.stage("remove", main_filepath) as record:
+        filtered_data = remove_dnc_numbers(main_data, dnc_numbers)
+        record["rows"] = len(filtered_data)
+
+    # Calculate the number of entries removed
+    entries_removed = len(main_data) - len(filtered_data)
+    if entries_removed == 0:
+        return 0, None
+
+    # Generate the new filename
+    original_filename = os.path.basename(main_filepath)
+    match = re.match(r"^(.*)\((\d+)\)\.xlsx$", original_filename)
+    if not match:
+        raise ValueError(f"'{original_filename}' is not named with an '(n).xlsx' entry count.")
+    prefix, total_entries = match.group(1), int(match.group(2))
+    new_filename = os.path.basename(writer.with_format(f"{prefix}({total_entries - entries_removed}).xlsx", fmt))
+    new_filepath = os.path.join(os.path.dirname(main_filepath), new_filename)
+
+    # Claim the new name before writing, so a sheet suppressed at the same time, or one already
+    # in the folder with that entry count, is never overwritten
+    try:
+        open(new_filepath, "x").close()
+    except FileExistsError:
+        raise ValueError(f"'{new_filename}' already exists, so '{original_filename}' was left as it is.") from None
+
+    # Save the filtered data to the new file
+    try:
+        with report.stage("save", new_filepath) as record:
+            writer.write_frame(filtered_data, new_filepath)
+            record["rows"] = len(filtered_data)
+    except BaseException:
+        if os.path.exists(new_filepath):
+            os.remove(new_filepath)
+        raise
+
+    # Delete the original file
+    os.remove(main_filepath)
+
+    return entries_removed, new_filename
+
+# Suppression list shared by the batch worker processes, sent once per worker
+_worker_dnc_numbers = None
+
+def _init_batch_worker(dnc_numbers):
+    global _worker_dnc_numbers
+    _worker_dnc_numbers = dnc_numbers
+
+def _suppress_main_file(main_filepath, fmt=None):
+    # The sheet is replaced straight away, so there is no point caching it
+    main_data = loader.read_excel(main_filepath, use_cache=False)
+    return suppress_main_sheet(main_filepath, main_data, _worker_dnc_numbers, fmt)
+
+def find_main_sheets(folder):
+    """Returns the main sheets in a folder, i.e. the workbooks named with an '(n).xlsx' entry count."""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if re.search(r"\(\d+\)\.xlsx$", name) and not name.startswith("~$")
+    )
+
+def suppress_folder(folder, dnc_numbers, max_workers=None, progress=None, fmt=None, report=instrument.NO_REPORT):
+    """Suppresses every main sheet in a folder against one DNC list, several sheets at a time.
+
+    Returns one summary row per sheet with the entries removed, the new filename and any error.
+    progress, if given, is called as progress(done, total, message) after each sheet.
+    """
+    main_filepaths = find_main_sheets(folder)
+    # Each sheet is timed inside its worker when profiling
+    results = loader.run_parallel(_suppress_main_file, [(main_filepath, (main_filepath, fmt)) for main_filepath in main_filepaths],
+                                  max_workers=max_workers, progress=progress, report=report, stage="suppress",
+                                  message="Suppressed {name}", initializer=_init_batch_worker, initargs=(dnc_numbers,))
+    summary = []
+    for main_filepath, result, error in results:
+        row = {"File": os.path.basename(main_filepath), "Entries Removed": 0, "New File": "", "Error": ""}
+        if error is None:
+            entries_removed, new_filename = result
+            row["Entries Removed"] = entries_removed
+            row["New File"] = new_filename or ""
+        else:
+            row["Error"] = str(error)
+        summary.append(row)
+    return summary
+
+def save_suppression_summary(summary, folder):
+    """Writes the batch summary as a CSV file, so it is never mistaken for a main sheet."""
+    save_path = os.path.join(folder, "DNC Summary.csv")
+    pd.DataFrame(summary, columns=["File", "Entries Removed", "New File", "Error"]).to_csv(save_path, index=False)
+    return save_path
+
+def build_ui(app, session=None):
+    """Builds the DNC remover into a window or launcher tab, loading through the shared session if given."""
+    from tkinter import filedialog
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    read_main_sheet = session.read_excel if session else loader.read_excel
 
     main_filepath = None
     main_data = None
-    dnc_filepath = None
-    dnc_data = None
+    run_report = None  # Timings of the current main sheet, saved when DLBEC_PROFILE is set
 
     def load_main_sheet():
-        nonlocal main_filepath, main_data
-        main_filepath, main_data = load_excel_file()
-        if main_data is not None:
-            choose_dnc_button["state"] = "normal"  # Enable DNC button after main sheet is chosen
+        filepath = tasks.choose_excel_file("Choose Main Sheet")
+        if not filepath:
+            return
+
+        report = instrument.RunReport("dnc")
+
+        def loaded(data):
+            nonlocal main_filepath, main_data, run_report
+            main_filepath, main_data, run_report = filepath, data, report
+            choose_dnc_button["state"] = "normal"  # Enable DNC buttons after main sheet is chosen
+            saved_dnc_button["state"] = "normal"
+
+        task_panel.run(lambda task: report.run("load", filepath, read_main_sheet, filepath), loaded, "Loading main sheet...",
+                       busy_widgets=all_buttons, error_message="Error loading file")
+
+    def show_suppression_result(result):
+        entries_removed, new_filename = result
+        if entries_removed > 0:
+            Messagebox.show_info(f"{entries_removed} entries were removed.\nFiltered file saved as:\n{new_filename}", "Success")
+        else:
+            # No entries were removed; do not delete the original file
+            Messagebox.show_info("No entries were removed.", "0 Entries Removed")
+
+    def run_suppression(read_numbers):
+        def suppress(task):
+            dnc_numbers = run_report.run("load dnc", None, read_numbers)
+            if not len(dnc_numbers):
+                raise ValueError("The DNC list is empty!")
+            task.report(1, 2, "Removing DNC entries...")
+            result = suppress_main_sheet(main_filepath, main_data, dnc_numbers, output_format, report=run_report)
+            if session and result[1]:
+                session.discard(main_filepath)  # The original sheet has been replaced
+            run_report.save(os.path.dirname(main_filepath))
+            return result
+
+        output_format = format_combo.get()
+        task_panel.run(suppress, show_suppression_result, "Loading DNC numbers...",
+                       busy_widgets=all_buttons, error_message="Error processing DNC data")
 
     def load_dnc_sheet():
-        nonlocal dnc_filepath, dnc_data
-        dnc_filepath, dnc_data = load_excel_file()
-        if dnc_data is not None:
+        dnc_filepath = tasks.choose_excel_file("Choose DNC Sheet")
+        if dnc_filepath:
             # Process the removal of DNC entries
-            try:
-                filtered_data = remove_dnc_entries(main_data, dnc_data)
-                
-                # Calculate the number of entries removed
-                entries_removed = len(main_data) - len(filtered_data)
-                
-                if entries_removed > 0:
-                    # Generate the new filename
-                    original_filename = os.path.basename(main_filepath)
-                    prefix, total_entries = original_filename.rsplit("(", 1)
-                    total_entries = int(total_entries.rstrip(").xlsx"))
-                    new_filename = f"{prefix}({total_entries - entries_removed}).xlsx"
-                    new_filepath = os.path.join(os.path.dirname(main_filepath), new_filename)
-                    
-                    # Save the filtered data to the new file
-                    filtered_data.to_excel(new_filepath, index=False, engine='openpyxl')
-                    
-                    # Delete the original file
-                    os.remove(main_filepath)
-                    
-                    Messagebox.show_info(f"{entries_removed} entries were removed.\nFiltered file saved as:\n{new_filename}", "Success")
-                else:
-                    # No entries were removed; do not delete the original file
-                    Messagebox.show_info("No entries were removed.", "0 Entries Removed")
-                
-            except Exception as e:
-                Messagebox.show_error(f"Error processing DNC data: {e}", "Error")
+            run_suppression(lambda: dnc_store.read_dnc_numbers(dnc_filepath))
+
+    def use_saved_dnc_list():
+        run_suppression(dnc_store.load_dnc_store)
+
+    def add_to_saved_dnc_list():
+        filepath = tasks.choose_excel_file("Choose DNC Sheet")
+        if not filepath:
+            return
+
+        def added(result):
+            dnc_numbers, numbers_added = result
+            Messagebox.show_info(f"{numbers_added} new numbers added.\nThe saved DNC list now holds {len(dnc_numbers)} numbers.", "Success")
+
+        task_panel.run(lambda task: dnc_store.update_dnc_store(filepath), added, "Updating the saved DNC list...",
+                       busy_widgets=all_buttons, error_message="Error updating the saved DNC list")
+
+    def suppress_main_folder():
+        folder = filedialog.askdirectory(title="Choose the folder of main sheets")
+        if not folder:
+            Messagebox.show_error("No folder selected!", "Error")
+            return
+        dnc_filepath = filedialog.askopenfilename(title="Choose DNC Sheet (cancel to use the saved DNC list)", filetypes=[("Excel files", "*.xlsx")])
+
+        def suppress(task):
+            report = instrument.RunReport("dnc")
+            # The DNC list is loaded once and shared by every sheet in the folder
+            if dnc_filepath:
+                dnc_numbers = report.run("load dnc", dnc_filepath, dnc_store.read_dnc_numbers, dnc_filepath)
+            else:
+                dnc_numbers = report.run("load dnc", dnc_store.DNC_STORE_PATH, dnc_store.load_dnc_store)
+            if not len(dnc_numbers):
+                raise ValueError("The DNC list is empty!")
+
+            summary = suppress_folder(folder, dnc_numbers, progress=task.report, fmt=output_format, report=report)
+            if not summary:
+                raise ValueError("No main sheets found in the folder!")
+            report.save(folder)
+            return summary, save_suppression_summary(summary, folder)
+
+        def suppressed(result):
+            summary, summary_path = result
+            total_removed = sum(row["Entries Removed"] for row in summary)
+            failed = sum(1 for row in summary if row["Error"])
+            Messagebox.show_info(f"{total_removed} entries were removed from {len(summary)} sheets ({failed} failed).\nSummary saved as:\n{summary_path}", "Success")
+
+        output_format = format_combo.get()
+        task_panel.run(suppress, suppressed, "Suppressing main sheets...",
+                       busy_widgets=all_buttons, error_message="Error processing DNC data")
 
     # Buttons
     choose_main_button = ttk.Button(app, text="Choose Main Sheet", command=load_main_sheet, bootstyle="success")
@@ -90,7 +223,41 @@ def main():
     
     choose_dnc_button = ttk.Button(app, text="Choose DNC Sheet", command=load_dnc_sheet, bootstyle="danger", state="disabled")
     choose_dnc_button.pack(pady=10)
-    
+
+    saved_dnc_button = ttk.Button(app, text="Use Saved DNC List", command=use_saved_dnc_list, bootstyle="danger", state="disabled")
+    saved_dnc_button.pack(pady=10)
+
+    add_dnc_button = ttk.Button(app, text="Add DNC Sheet to Saved List", command=add_to_saved_dnc_list, bootstyle="info")
+    add_dnc_button.pack(pady=10)
+
+    batch_button = ttk.Button(app, text="Suppress Folder of Main Sheets", command=suppress_main_folder, bootstyle="warning")
+    batch_button.pack(pady=10)
+
+    # Output format of the suppressed sheets
+    format_combo = ttk.Combobox(app, values=writer.FORMATS, state="readonly", width=8, bootstyle="dark")
+    format_combo.set(writer.DEFAULT_FORMAT)
+    format_combo.pack(pady=10)
+
+    all_buttons = [choose_main_button, choose_dnc_button, saved_dnc_button, add_dnc_button, batch_button, format_combo]
+
+    # Progress of the current task, with a Cancel button
+    task_panel = tasks.TaskPanel(app)
+    task_panel.pack(pady=10)
+
+
+def main():
+    from tkinter import Tk
+    import ttkbootstrap as ttk
+    app = Tk()
+    app.title("DLBEC Objection Remover")
+    app.geometry("600x500")
+    app.iconbitmap("app_icon.ico")  # Set app icon
+
+    # Apply the ttkbootstrap theme correctly
+    app.tk_setPalette(background='#1E1E1E')  # Sets dark background
+    style = ttk.Style("darkly")
+
+    build_ui(app)
     app.mainloop()
 
 if __name__ == "__main__":
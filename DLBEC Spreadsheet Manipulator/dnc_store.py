@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import loader
+
+
+# File holding the saved suppression list (set DLBEC_DNC_STORE to move it)
+DNC_STORE_PATH = os.environ.get("DLBEC_DNC_STORE", os.path.join(os.path.expanduser("~"), ".dlbec_dnc_store.npy"))
+
+# Longest digit string that still fits in an int64
+MAX_PHONE_DIGITS = 18
+
+
+def normalize_phone_numbers(series):
+    """Normalizes phone numbers to Int64 so that '07123 456789', '+447123456789' and 7123456789 all match.
+
+    Spaces and punctuation are removed, a +44/0044 country code becomes the leading 0 and the
+    leading 0 itself is dropped by the integer conversion. Blank or unusable values become <NA>.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.round().astype("Int64")
+
+    text = series.astype("string").str.strip()
+    text = text.str.replace(r"\.0+$", "", regex=True)  # Numbers that were stored as floats
+    text = text.str.replace(r"^(\+|00)44", "0", regex=True)
+    digits = text.str.replace(r"\D", "", regex=True)
+    digits = digits.where((digits.str.len() > 0) & (digits.str.len() <= MAX_PHONE_DIGITS))
+    return pd.to_numeric(digits, errors="coerce").astype("Int64")
+
+
+def build_dnc_numbers(series):
+    """Returns the normalized numbers of a column as a sorted, de-duplicated int64 array."""
+    numbers = normalize_phone_numbers(series).dropna().to_numpy(dtype=np.int64)
+    return np.unique(numbers)
+
+
+def merge_dnc_numbers(*arrays):
+    """Merges sorted number arrays into one sorted, de-duplicated array."""
+    arrays = [array for array in arrays if len(array)]
+    if not arrays:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(arrays))
+
+
+def is_dnc_number(series, dnc_numbers):
+    """Returns a boolean mask of the values in the column that appear in the sorted DNC array."""
+    numbers = normalize_phone_numbers(series)
+    valid = numbers.notna().to_numpy()
+    values = numbers.fillna(-1).to_numpy(dtype=np.int64)
+    if not len(dnc_numbers):
+        return pd.Series(False, index=series.index)
+
+    # Binary search every value against the sorted list at once
+    positions = np.searchsorted(dnc_numbers, values).clip(max=len(dnc_numbers) - 1)
+    return pd.Series(valid & (dnc_numbers[positions] == values), index=series.index)
+
+
+def read_dnc_numbers(filepath, column="Telephone Number"):
+    """Streams a DNC sheet in chunks and returns its normalized numbers as a sorted array."""
+    arrays = []
+    # Only the number column is read from the sheet
+    for chunk in loader.iter_excel_chunks(filepath, columns=[column]):
+        arrays.append(build_dnc_numbers(chunk[column]))
+    return merge_dnc_numbers(*arrays)
+
+
+def load_dnc_store(store_path=DNC_STORE_PATH):
+    """Loads the saved suppression list, or an empty one if nothing has been saved yet."""
+    if not os.path.exists(store_path):
+        return np.empty(0, dtype=np.int64)
+    return np.load(store_path)
+
+
+def save_dnc_store(dnc_numbers, store_path=DNC_STORE_PATH):
+    """Saves the suppression list, replacing the old file only once the new one is fully written."""
+    directory = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, dnc_numbers)
+    os.replace(temp_path, store_path)
+
+
+def update_dnc_store(filepath, store_path=DNC_STORE_PATH, column="Telephone Number"):
+    """Adds the numbers from a DNC sheet to the saved suppression list.
+
+    Returns the updated list and how many new numbers were added to it.
+    """
+    dnc_numbers = load_dnc_store(store_path)
+    updated = merge_dnc_numbers(dnc_numbers, read_dnc_numbers(filepath, column))
+    save_dnc_store(updated, store_path)
+    return updated, len(updated) - len(dnc_numbers)
@@ -1,138 +1,301 @@
-import ttkbootstrap as ttk
-from ttkbootstrap.dialogs import Messagebox
 import pandas as pd
-from tkinter import filedialog
+import cache
+import loader
+import postcode
+import tasks
+import writer
+import instrument
 import os
-from PIL import Image, ImageTk  # Importing Pillow for image handling
-
-def load_excel_files():
-    """Prompts the user to select multiple Excel files and loads them."""
-    filepaths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx")])
-    if not filepaths:
-        Messagebox.show_error("No files selected!", "Error")
-        return None
-    files_data = []
-    for filepath in filepaths:
-        try:
-            data = pd.read_excel(filepath, engine='openpyxl')
-            files_data.append((filepath, data))
-        except Exception as e:
-            Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
-            continue
-    return files_data
+from collections import OrderedDict
 
 def get_unique_postcode_prefixes(df, column):
-    """Extracts unique postcode prefixes (first two letters, case insensitive) from the specified column."""
+    """Extracts the unique postcode areas (the leading letters, case insensitive) from the specified column.
+
+    The DataFrame is left untouched; missing postcodes have no prefix.
+    """
     if column not in df.columns:
         raise ValueError(f"Selected column '{column}' not found in the dataset.")
-    
-    df[column] = df[column].astype(str)  # Ensure the column is treated as strings
-    prefixes = df[column].apply(lambda x: x[:2].upper() if isinstance(x, str) else "").unique()
-    return sorted(prefixes)
+
+    prefixes = get_postcode_prefixes(df[column]).dropna().unique()
+    return sorted(prefix for prefix in prefixes if prefix)
 
 def filter_by_postcode(df, column, prefix):
-    """Filters rows where the selected column contains the given postcode prefix (case insensitive)."""
-    filtered_data = df[df[column].str.contains(prefix, case=False, na=False)]
-    return filtered_data
+    """Filters the rows whose postcode matches any of the prefixes, e.g. "B, BS, CV1-CV9" (see postcode.py).
+
+    The postcodes are parsed and matched against every prefix in one pass over the column.
+    """
+    return df[postcode.PostcodeIndex(df[column]).match(prefix)]
+
+def get_postcode_prefixes(series):
+    """Returns the area (the leading letters, upper case) of every postcode in a column.
+
+    Values with no postcode area get a missing prefix so they fall out of any grouping.
+    """
+    return postcode.PostcodeIndex(series).get_areas()
+
+def partition_by_postcode(df, column):
+    """Splits the rows into one DataFrame per postcode prefix in a single pass over the column."""
+    if column not in df.columns:
+        raise ValueError(f"Selected column '{column}' not found in the dataset.")
+    prefixes = get_postcode_prefixes(df[column])
+    return {prefix: group for prefix, group in df.groupby(prefixes, sort=True) if prefix}
+
+# Number of (file, column) prefix counts kept, the least recently used being dropped first
+PREFIX_COUNTS_CACHE_SIZE = 64
+
+# Prefix counts already worked out, by file identity and column, so reselecting a column is instant
+_prefix_counts_cache = OrderedDict()
+
+def count_postcode_prefixes(series):
+    """Returns the number of rows for every postcode prefix in a column, as a Series indexed by prefix."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Count each distinct postcode once, then add the counts up by prefix
+        counts = series.value_counts(sort=False)
+        counts = counts.groupby(get_postcode_prefixes(pd.Series(counts.index.astype(object))).to_numpy(), sort=True).sum()
+    else:
+        counts = get_postcode_prefixes(series).value_counts(sort=False).sort_index()
+    counts = counts[counts.index != ""].astype("int64")
+    counts.index = counts.index.astype(object)
+    counts.index.name = "prefix"
+    return counts.rename("rows")
 
-def save_filtered_data(filtered_data, filepath, prefix):
-    """Saves the filtered data to a new Excel file in the 'Clean Files' folder."""
+def get_prefix_counts(filepath, data, column):
+    """Counts the postcode prefixes of one loaded file, reusing the counts from an earlier call."""
+    if column not in data.columns:
+        raise ValueError(f"Selected column '{column}' not found in the dataset.")
+    key = (filepath, cache.file_identity(filepath), len(data), column)
+    counts = _prefix_counts_cache.get(key)
+    if counts is None:
+        counts = count_postcode_prefixes(data[column])
+        _prefix_counts_cache[key] = counts
+        while len(_prefix_counts_cache) > PREFIX_COUNTS_CACHE_SIZE:
+            _prefix_counts_cache.popitem(last=False)
+    _prefix_counts_cache.move_to_end(key)
+    return counts
+
+def get_prefix_stats(files_data, column, progress=None):
+    """Returns the total rows per postcode prefix across all loaded files, largest first.
+
+    Files without the column are skipped and returned as a list of their paths alongside the totals.
+    progress, if given, is called as progress(done, total, message) before each file.
+    """
+    counts = []
+    missing = []
+    for i, (filepath, data) in enumerate(files_data):
+        if progress:
+            progress(i, len(files_data), f"Counting {os.path.basename(filepath)}")
+        if column not in data.columns:
+            missing.append(filepath)
+            continue
+        counts.append(get_prefix_counts(filepath, data, column))
+    if not counts:
+        raise ValueError(f"Selected column '{column}' not found in any of the files.")
+    stats = pd.concat(counts, axis=1).fillna(0).sum(axis=1).astype("int64").rename("rows")
+    stats.index.name = "prefix"
+    return stats.sort_values(ascending=False, kind="stable"), missing
+
+def get_filtered_save_path(filtered_data, filepath, prefix, fmt=None):
+    """Returns the path in the 'Clean Files' folder that the filtered data is saved to, in the chosen output format."""
     # Get the directory of the original file
     directory = os.path.dirname(filepath)
-    
+
     # Ensure the "Clean Files" folder exists
     clean_folder = os.path.join(directory, "Clean Files")
     os.makedirs(clean_folder, exist_ok=True)
-    
+
     # Generate the filename with one less row to account for headers
     num_rows = len(filtered_data) - 1  # Subtract 1 for the header
-    filename = f"{prefix.upper()} Postcode ({num_rows}).xlsx" if num_rows >= 0 else f"{prefix.upper()} Postcode (0).xlsx"
-    save_path = os.path.join(clean_folder, filename)
-    
-    # Save the filtered data to a new file
-    try:
-        filtered_data.to_excel(save_path, index=False, engine='openpyxl')
-        Messagebox.show_info(f"Filtered data saved successfully to {save_path}", "Success")
-    except Exception as e:
-        Messagebox.show_error(f"Error saving file: {e}", "Error")
+    prefix = postcode.format_prefix_spec(prefix)
+    filename = f"{prefix} Postcode ({num_rows}).xlsx" if num_rows >= 0 else f"{prefix} Postcode (0).xlsx"
+    return writer.with_format(os.path.join(clean_folder, filename), fmt)
 
-def main():
-    app = ttk.Window(title="DLBEC SM", themename="darkly", size=(600, 400))
-    
-    # Set the window icon (make sure the .ico file is in the same directory)
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(script_dir, "app_icon.ico")
-    logo_path = os.path.join(script_dir, "logo.png")
-    app.iconbitmap(icon_path)
-    
-    # Load logo image and display in the window
-    try:
-        logo_image = Image.open(logo_path)  # Replace with your logo filename
-        logo_image = logo_image.resize((100, 100))
-        logo_photo = ImageTk.PhotoImage(logo_image)
-        logo_label = ttk.Label(app, image=logo_photo)
-        logo_label.image = logo_photo
-        logo_label.pack(pady=10)
-    except FileNotFoundError:
-        Messagebox.show_warning("Logo image not found!", "Warning")
+def write_filtered_data(filtered_data, save_path):
+    """Writes the filtered data to the given path, in the format its extension names."""
+    return writer.write_frame(filtered_data, save_path)
+
+def save_partitions(partitions, filepath, max_workers=None, progress=None, fmt=None):
+    """Saves one file per postcode prefix, writing them across a process pool.
+
+    Returns the saved paths and a list of (prefix, error) pairs for the workbooks that failed.
+    progress, if given, is called as progress(done, total, message) after each workbook.
+    """
+    jobs = [(prefix, (data, get_filtered_save_path(data, filepath, prefix, fmt))) for prefix, data in partitions.items()]
+    results = loader.run_parallel(write_filtered_data, jobs, max_workers=max_workers, progress=progress, message="Saved {name} postcodes")
+    save_paths = [save_path for _, save_path, error in results if error is None]
+    errors = [(prefix, error) for prefix, _, error in results if error is not None]
+    return save_paths, errors
+
+def build_ui(app, session=None):
+    """Builds the extractor into a window or launcher tab, loading through the shared session if given."""
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    load_files = session.load if session else loader.load_excel_files_parallel
 
     # Create variables for data and selections
     selected_column = None
     selected_prefix = None
     files_data = None
+    run_report = None  # Timings of the loaded files, saved with every output when DLBEC_PROFILE is set
     
     def on_choose_files():
-        nonlocal files_data
-        
+        filepaths = tasks.choose_excel_files()
+        if not filepaths:
+            return
+
         # Disable the button after selecting the files
         choose_file_button.config(state="disabled")
 
-        # Load the selected Excel files
-        files_data = load_excel_files()
-        if not files_data:
-            return
-        
-        # Enable and reset the combo boxes for column selection
-        columns = list(files_data[0][1].columns)  # Get columns from the first file
-        col_combo['values'] = columns
-        col_combo.set("")  # Clear previous selection
-        prefix_entry.delete(0, 'end')  # Clear the prefix entry
-        col_combo.config(state="normal")
-        save_button.config(state="disabled")  # Disable "Save Data" initially
+        report = instrument.RunReport("extract")
+
+        def load(task):
+            # Load the files in parallel; a file that fails does not stop the others
+            return load_files(filepaths, progress=task.report, report=report)
+
+        def loaded(result):
+            nonlocal files_data, run_report
+            files_data, errors = result
+            run_report = report
+            for filepath, e in errors:
+                Messagebox.show_error(f"Error loading file {filepath}: {e}", "Error")
+            if not files_data:
+                return
+
+            # Enable and reset the combo boxes for column selection
+            columns = list(files_data[0][1].columns)  # Get columns from the first file
+            col_combo['values'] = columns
+            col_combo.set("")  # Clear previous selection
+            prefix_entry.delete(0, 'end')  # Clear the prefix entry
+            stats_table.delete(*stats_table.get_children())  # Clear the prefix counts of the previous files
+            col_combo.config(state="normal")
+            save_button.config(state="disabled")  # Disable "Save Data" initially
+            split_button.config(state="disabled")
+
+        task_panel.run(load, loaded, "Loading files...")
     
     def on_column_select(event):
         nonlocal selected_column
         selected_column = col_combo.get()
-        if selected_column:
-            try:
-                prefixes = get_unique_postcode_prefixes(files_data[0][1], selected_column)
-            except ValueError as e:
-                Messagebox.show_error(f"Error: {e}", "Error")
-                return
+        if not selected_column:
+            return
+        column, loaded_files = selected_column, files_data
+
+        # The counts of the previous column no longer apply
+        stats_table.delete(*stats_table.get_children())
+        split_button.config(state="disabled")
+
+        def count(task):
+            # Counted across every loaded file, and cached, so reselecting a column is instant
+            return get_prefix_stats(loaded_files, column, progress=task.report)
+
+        def counted(result):
+            stats, missing = result
+            for filepath in missing:
+                Messagebox.show_warning(f"Column '{column}' not found in file {filepath}!", "Warning")
+
+            # Show how many rows every prefix would extract before anything is written
+            for prefix, rows in stats.items():
+                stats_table.insert("", "end", values=(prefix, f"{rows:,}"))
+            split_button.config(state="normal")  # A column is enough to split by every prefix
+
+        task_panel.run(count, counted, "Counting postcode prefixes...", busy_widgets=busy_widgets)
+
+    def on_stats_select(event):
+        """Fill in the prefix entry with the prefix picked in the table."""
+        selection = stats_table.selection()
+        if selection:
+            prefix_entry.delete(0, 'end')
+            prefix_entry.insert(0, stats_table.item(selection[0], "values")[0])
+            on_prefix_entry_change()
 
     def on_save_data():
-        nonlocal files_data, selected_column, selected_prefix
+        nonlocal selected_prefix
         
         # Get the prefix from the entry field
         selected_prefix = prefix_entry.get().strip()
         if not selected_prefix:
             Messagebox.show_error("Please enter a postcode prefix!", "Error")
             return
+        try:
+            postcode.parse_prefix_spec(selected_prefix)
+        except ValueError as e:
+            Messagebox.show_error(f"Error: {e}", "Error")
+            return
+
+        # Read on the UI thread, so changing the column or loading other files mid-task changes nothing
+        column, prefix, loaded_files, report = selected_column, selected_prefix, files_data, run_report
+
+        def save(task):
+            # Messages are collected here and shown once the task is back on the UI thread
+            messages = []
+            for i, (filepath, data) in enumerate(loaded_files):
+                task.report(i, len(loaded_files), f"Filtering {os.path.basename(filepath)}")
+
+                # Check if the column exists
+                if column not in data.columns:
+                    messages.append(("error", f"Column '{column}' not found in file {filepath}!"))
+                    continue
+
+                # Filter and save the data
+                filtered_data = report.run("filter", filepath, filter_by_postcode, data, column, prefix)
+                if filtered_data.empty:
+                    messages.append(("error", f"No matching entries found in file {filepath}!"))
+                    continue
+
+                save_path = get_filtered_save_path(filtered_data, filepath, prefix, output_format)
+                try:
+                    with report.stage("save", save_path) as record:
+                        write_filtered_data(filtered_data, save_path)
+                        record["rows"] = len(filtered_data)
+                    messages.append(("info", f"Filtered data saved successfully to {save_path}"))
+                except Exception as e:
+                    messages.append(("error", f"Error saving file: {e}"))
+            report.save(os.path.join(os.path.dirname(loaded_files[0][0]), "Clean Files"))
+            return messages
+
+        output_format = format_combo.get()
+        task_panel.run(save, show_messages, "Saving filtered data...", busy_widgets=busy_widgets)
+
+    def on_split_data():
+        column, loaded_files, report = selected_column, files_data, run_report
+
+        def split(task):
+            messages = []
+            saved_count = 0
+            for filepath, data in loaded_files:
+                # Group the rows by prefix in one pass, then write one workbook per prefix
+                try:
+                    with report.stage("partition", filepath) as record:
+                        partitions = partition_by_postcode(data, column)
+                        record["rows"] = len(data)
+                except ValueError as e:
+                    messages.append(("error", f"Error in file {filepath}: {e}"))
+                    continue
+                if not partitions:
+                    messages.append(("error", f"No postcodes found in file {filepath}!"))
+                    continue
+
+                with report.stage("save", filepath) as record:
+                    save_paths, errors = save_partitions(partitions, filepath, progress=task.report, fmt=output_format)
+                    record["rows"] = len(data)
+                for prefix, e in errors:
+                    messages.append(("error", f"Error saving {prefix} postcodes from {filepath}: {e}"))
+                saved_count += len(save_paths)
+
+            if saved_count:
+                messages.append(("info", f"{saved_count} postcode files saved to the 'Clean Files' folder."))
+            report.save(os.path.join(os.path.dirname(loaded_files[0][0]), "Clean Files"))
+            return messages
+
+        output_format = format_combo.get()
+        task_panel.run(split, show_messages, "Splitting by postcode prefix...", busy_widgets=busy_widgets)
+
+    def show_messages(messages):
+        for kind, message in messages:
+            if kind == "error":
+                Messagebox.show_error(message, "Error")
+            else:
+                Messagebox.show_info(message, "Success")
 
-        for filepath, data in files_data:
-            # Check if the column exists
-            if selected_column not in data.columns:
-                Messagebox.show_error(f"Column '{selected_column}' not found in file {filepath}!", "Error")
-                continue
-            
-            # Filter and save the data
-            filtered_data = filter_by_postcode(data, selected_column, selected_prefix)
-            if filtered_data.empty:
-                Messagebox.show_error(f"No matching entries found in file {filepath}!", "Error")
-                continue
-            
-            save_filtered_data(filtered_data, filepath, selected_prefix)
-    
     def on_prefix_entry_change(*args):
         """Enable Save Data button when the entry has text."""
         if prefix_entry.get().strip():  # If the entry box is not empty
@@ -155,7 +318,7 @@ def main():
     combo_frame.pack(pady=10)
 
     # Add a label describing how to choose the columns
-    choice_label = ttk.Label(combo_frame, text="Choose the column and enter the postcode prefix to filter by.", bootstyle="info")
+    choice_label = ttk.Label(combo_frame, text="Choose the column and enter the postcode prefixes to filter by, e.g. B, BS, CV1-CV9.", bootstyle="info")
     choice_label.pack(pady=4, side="top")
 
     # Column selection combo box
@@ -164,13 +327,27 @@ def main():
     col_combo.pack(padx=5, pady=10, side="left")
 
     # Postcode prefix entry box
-    prefix_label = ttk.Label(combo_frame, text="Enter Postcode Prefix:", bootstyle="info")
+    prefix_label = ttk.Label(combo_frame, text="Enter Postcode Prefixes:", bootstyle="info")
     prefix_label.pack(pady=4, side="top")
 
     prefix_entry = ttk.Entry(combo_frame, bootstyle="dark")
     prefix_entry.bind("<KeyRelease>", on_prefix_entry_change)
     prefix_entry.pack(padx=5, pady=10, side="left")
 
+    # Rows per postcode prefix across all the loaded files; clicking one fills in the prefix
+    stats_frame = ttk.Frame(app)
+    stats_frame.pack(pady=4)
+    stats_table = ttk.Treeview(stats_frame, columns=("prefix", "rows"), show="headings", height=6, bootstyle="dark")
+    stats_table.heading("prefix", text="Prefix")
+    stats_table.heading("rows", text="Rows")
+    stats_table.column("prefix", width=100, anchor="center")
+    stats_table.column("rows", width=120, anchor="e")
+    stats_table.bind("<<TreeviewSelect>>", on_stats_select)
+    stats_table.pack(side="left")
+    stats_scrollbar = ttk.Scrollbar(stats_frame, orient="vertical", command=stats_table.yview)
+    stats_table.configure(yscrollcommand=stats_scrollbar.set)
+    stats_scrollbar.pack(side="left", fill="y")
+
     # Set up save frame
     save_frame = ttk.Frame(app)
     save_frame.pack(pady=10)
@@ -179,13 +356,55 @@ def main():
     save_label = ttk.Label(save_frame, text="Files will be saved to the 'Clean Files' folder.", bootstyle="info")
     save_label.pack(pady=4, side="top")
 
+    # Output format of the saved files
+    format_combo = ttk.Combobox(save_frame, values=writer.FORMATS, state="readonly", width=8, bootstyle="dark")
+    format_combo.set(writer.DEFAULT_FORMAT)
+    format_combo.pack(pady=10, padx=10, side="left")
+
     # Save Data button
     save_button = ttk.Button(save_frame, text="Save Data", command=on_save_data, state="disabled", bootstyle="primary")
-    save_button.pack(pady=10, padx=10)
+    save_button.pack(pady=10, padx=10, side="left")
+
+    # Split by All Prefixes button
+    split_button = ttk.Button(save_frame, text="Split by All Prefixes", command=on_split_data, state="disabled", bootstyle="primary")
+    split_button.pack(pady=10, padx=10, side="left")
+
+    # Progress of the current load or save, with a Cancel button
+    task_panel = tasks.TaskPanel(app)
+    task_panel.pack(pady=10)
+
+    # Disabled while the prefixes are counted or a save or split runs
+    busy_widgets = [choose_file_button, col_combo, prefix_entry, save_button, split_button, format_combo]
+
+
+def main():
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    from PIL import Image, ImageTk  # Importing Pillow for image handling
+    app = ttk.Window(title="DLBEC SM", themename="darkly", size=(600, 720))
+    
+    # Set the window icon (make sure the .ico file is in the same directory)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    icon_path = os.path.join(script_dir, "app_icon.ico")
+    logo_path = os.path.join(script_dir, "logo.png")
+    app.iconbitmap(icon_path)
+    
+    # Load logo image and display in the window
+    try:
+        logo_image = Image.open(logo_path)  # Replace with your logo filename
+        logo_image = logo_image.resize((100, 100))
+        logo_photo = ImageTk.PhotoImage(logo_image)
+        logo_label = ttk.Label(app, image=logo_photo)
+        logo_label.image = logo_photo
+        logo_label.pack(pady=10)
+    except FileNotFoundError:
+        Messagebox.show_warning("Logo image not found!", "Warning")
+
+    build_ui(app)
 
     # Center the window on the screen
     window_width = 600
-    window_height = 450
+    window_height = 720
     screen_width = app.winfo_screenwidth()
     screen_height = app.winfo_screenheight()
     position_top = int(screen_height / 2 - window_height / 2)
@@ -0,0 +1,129 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Set DLBEC_PROFILE=1 to write a timing report next to the output of every run
+PROFILE_ENABLED = os.environ.get("DLBEC_PROFILE", "0") not in ("", "0")
+
+# Memory tracking slows the stages down several times; set DLBEC_PROFILE_MEMORY=0 for true timings
+MEMORY_ENABLED = os.environ.get("DLBEC_PROFILE_MEMORY", "1") != "0"
+
+
+def _file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except (OSError, TypeError):
+        return None
+
+
+@contextmanager
+def measure_stage(stage, filepath=None):
+    """Times one stage and tracks its peak Python memory, yielding the record to fill in.
+
+    The caller can set record["rows"]; record["bytes"] is the size of filepath once the stage ends,
+    i.e. the input file for a load and the output file for a save.
+    """
+    record = {"stage": stage, "file": os.path.basename(filepath) if filepath else None, "rows": None, "peak_mb": None}
+    started_tracing = MEMORY_ENABLED and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif MEMORY_ENABLED:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        if MEMORY_ENABLED:
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        if started_tracing:
+            tracemalloc.stop()
+        record["bytes"] = _file_size(filepath)
+
+
+def measured(stage, filepath, func, *args):
+    """Calls func(*args) inside a measured stage and returns (result, record).
+
+    Module level so it can be submitted to a process pool and time the work inside the worker.
+    """
+    with measure_stage(stage, filepath) as record:
+        result = func(*args)
+        # Loads return the frame and writes the number of rows written
+        if isinstance(result, int) and not isinstance(result, bool):
+            record["rows"] = result
+        elif hasattr(result, "__len__") and not isinstance(result, (str, tuple)):
+            record["rows"] = len(result)
+    return result, record
+
+
+class RunReport:
+    """Collects per-file, per-stage timings for one run of a tool and saves them as JSON.
+
+    When the report is disabled every method is a cheap no-op, so the hooks can stay in place.
+    """
+
+    def __init__(self, tool, enabled=None):
+        self.tool = tool
+        self.enabled = PROFILE_ENABLED if enabled is None else enabled
+        self.records = []
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage, filepath=None):
+        if not self.enabled:
+            yield {}
+            return
+        with measure_stage(stage, filepath) as record:
+            yield record
+        self.records.append(record)
+
+    def add(self, record):
+        """Adds a record measured elsewhere, e.g. in a worker process."""
+        if self.enabled and record:
+            self.records.append(record)
+
+    def run(self, stage, filepath, func, *args):
+        """Calls func(*args) as a measured stage and returns its result."""
+        if not self.enabled:
+            return func(*args)
+        result, record = measured(stage, filepath, func, *args)
+        self.records.append(record)
+        return result
+
+    def summary(self):
+        """Returns the totals of every stage, in the order the stages first ran."""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"stage": record["stage"], "files": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "peak_mb": None})
+            total["files"] += 1
+            total["seconds"] = round(total["seconds"] + record["seconds"], 4)
+            total["rows"] += record["rows"] or 0
+            total["bytes"] += record["bytes"] or 0
+            if record["peak_mb"] is not None:
+                total["peak_mb"] = max(total["peak_mb"] or 0.0, record["peak_mb"])
+        return list(totals.values())
+
+    def save(self, folder):
+        """Writes the report into the output folder and returns its path (None when disabled)."""
+        if not self.enabled:
+            return None
+        report = {
+            "tool": self.tool,
+            "started": self.started,
+            "seconds": round(time.perf_counter() - self.start, 4),
+            "stages": self.summary(),
+            "records": self.records,
+        }
+        os.makedirs(folder, exist_ok=True)
+        save_path = os.path.join(folder, f"dlbec_{self.tool}_report_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return save_path
+
+
+# Default for functions that take a report, so they can use the hooks without checking for None
+NO_REPORT = RunReport("none", enabled=False)
@@ -0,0 +1,94 @@
+"""Opens the four tools as tabs of one window, sharing one session of loaded workbooks.
+
+    python launcher.py
+
+A workbook loaded in one tab is kept in memory (see session.py), so choosing it again in any
+tab, e.g. to combine, then suppress, split or trim it, does not parse it again.
+"""
+import os
+
+import column_omitter
+import combiner
+import dnc_remover
+import extractor
+import session
+
+# Tab title and module of every tool, in the order the tabs are shown
+TOOLS = (
+    ("Combine", combiner),
+    ("Extract Postcodes", extractor),
+    ("Remove DNC", dnc_remover),
+    ("Omit Columns", column_omitter),
+)
+
+# Milliseconds between refreshes of the session summary
+REFRESH_MS = 1000
+
+
+def describe_session(shared_session):
+    """Returns a one-line summary of the loaded workbooks and the memory they take up."""
+    entries = shared_session.describe()
+    rows = sum(rows for _, rows, _ in entries)
+    used_mb = sum(nbytes for _, _, nbytes in entries) / 1024 / 1024
+    limit_mb = shared_session.memory_limit / 1024 / 1024
+    return f"Loaded: {len(entries)} workbooks, {rows:,} rows, {used_mb:,.0f} of {limit_mb:,.0f} MB"
+
+
+def main():
+    import ttkbootstrap as ttk
+    from ttkbootstrap.dialogs import Messagebox
+    from PIL import Image, ImageTk
+    app = ttk.Window(title="DLBEC Spreadsheet Manipulator", themename="darkly", size=(650, 860))
+
+    # Set the window icon (make sure the .ico file is in the same directory)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    app.iconbitmap(os.path.join(script_dir, "app_icon.ico"))
+
+    # Load logo image and display in the window
+    try:
+        logo_image = Image.open(os.path.join(script_dir, "logo.png")).resize((80, 80))
+        logo_photo = ImageTk.PhotoImage(logo_image)
+        logo_label = ttk.Label(app, image=logo_photo)
+        logo_label.image = logo_photo
+        logo_label.pack(pady=6)
+    except FileNotFoundError:
+        Messagebox.show_warning("Logo image not found!", "Warning")
+
+    shared_session = session.Session()
+
+    # Loaded workbooks and the memory they take up, with a button to free it
+    session_frame = ttk.Frame(app)
+    session_frame.pack(side="bottom", pady=6)
+    session_label = ttk.Label(session_frame, text="", bootstyle="info")
+    session_label.pack(padx=5, side="left")
+    clear_button = ttk.Button(session_frame, text="Clear Loaded Files", command=shared_session.clear, bootstyle="secondary")
+    clear_button.pack(padx=5, side="left")
+
+    # One tab per tool, all loading through the shared session
+    notebook = ttk.Notebook(app, bootstyle="dark")
+    notebook.pack(fill="both", expand=True, padx=10, pady=6)
+    for title, tool in TOOLS:
+        tab = ttk.Frame(notebook)
+        notebook.add(tab, text=title)
+        tool.build_ui(tab, shared_session)
+
+    def refresh_session_label():
+        session_label.config(text=describe_session(shared_session))
+        app.after(REFRESH_MS, refresh_session_label)
+
+    refresh_session_label()
+
+    # Center the window on the screen
+    window_width = 650
+    window_height = 860
+    screen_width = app.winfo_screenwidth()
+    screen_height = app.winfo_screenheight()
+    position_top = int(screen_height / 2 - window_height / 2)
+    position_right = int(screen_width / 2 - window_width / 2)
+    app.geometry(f'{window_width}x{window_height}+{position_right}+{position_top}')
+
+    app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cache
+import instrument
+import reader
+
+
+# Number of rows per DataFrame yielded by iter_excel_chunks
+DEFAULT_CHUNKSIZE = 50000
+
+# Number of worker processes used by load_excel_files_parallel (None uses one per CPU)
+DEFAULT_MAX_WORKERS = int(os.environ.get("DLBEC_LOAD_WORKERS", 0)) or None
+
+# Set DLBEC_OPTIMIZE_DTYPES=0 to keep loaded sheets in the dtypes pandas infers
+OPTIMIZE_DTYPES = os.environ.get("DLBEC_OPTIMIZE_DTYPES", "1") != "0"
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Sheets shorter than this keep their text columns as they are; categoricals only pay off on longer ones
+CATEGORY_MIN_ROWS = 1000
+
+# Strings that pandas treats as missing values when reading a sheet
+NA_VALUES = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}
+
+
+def _trim_row(row):
+    """Drops the empty cells at the end of a row, as pandas does, so formatted blank cells add no columns."""
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row if end == len(row) else row[:end]
+
+
+def _make_header(values):
+    """Builds pandas-style column names, filling blanks and de-duplicating repeats."""
+    header = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        header.append(name)
+    return header
+
+
+def _convert_value(value):
+    """Converts a raw cell value the same way pandas does when reading a sheet."""
+    if isinstance(value, str):
+        return None if value in NA_VALUES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _is_blank(row):
+    return all(value is None for value in row)
+
+
+def _iter_data_rows(rows):
+    """Yields the rows, holding blank rows back until data follows them, as pandas drops trailing ones."""
+    pending_blank_rows = 0
+    for row in rows:
+        if _is_blank(row):
+            pending_blank_rows += 1
+            continue
+        for _ in range(pending_blank_rows):
+            yield ()
+        pending_blank_rows = 0
+        yield row
+
+
+def _column_indexes(header, columns):
+    """Returns the positions of the named columns in the header."""
+    positions = {name: i for i, name in enumerate(header)}
+    missing = [name for name in columns if name not in positions]
+    if missing:
+        raise ValueError(f"Column '{missing[0]}' not found in the dataset.")
+    return [positions[name] for name in columns]
+
+
+def _build_frame(header, buffers, convert=True):
+    """Turns the column buffers into a DataFrame with numeric text converted to numbers, unless convert is False."""
+    if not convert:
+        # Every cell is kept as read, for convert_numeric to type once the whole sheet has been seen
+        return pd.DataFrame({name: buffer for name, buffer in zip(header, buffers)}, columns=header, dtype=object)
+    data = pd.DataFrame({name: buffer for name, buffer in zip(header, buffers)}, columns=header)
+    for name in header:
+        column = data[name]
+        if column.dtype == object or pd.api.types.is_string_dtype(column):
+            try:
+                data[name] = pd.to_numeric(column)
+            except (ValueError, TypeError):
+                pass
+    return data
+
+
+def get_numeric_dtypes(data):
+    """Returns the dtype each column of a raw chunk converts to as numbers, None for columns holding other values."""
+    dtypes = {}
+    for name in data.columns:
+        try:
+            dtypes[name] = pd.to_numeric(data[name]).dtype
+        except (ValueError, TypeError):
+            dtypes[name] = None
+    return dtypes
+
+
+def merge_numeric_dtypes(dtypes, chunk_dtypes):
+    """Returns the numeric dtypes of a sheet read so far (None before its first chunk) combined with those of its next raw chunk.
+
+    A column is numeric only if it is in every chunk. A column first seen in a later chunk was empty in
+    the earlier ones, which read as float NaN, just as when the sheet is read whole.
+    """
+    if dtypes is None:
+        return dict(chunk_dtypes)
+    merged = {}
+    for name, dtype in chunk_dtypes.items():
+        earlier = dtypes.get(name, np.dtype(np.float64))
+        merged[name] = None if earlier is None or dtype is None else np.result_type(earlier, dtype)
+    return merged
+
+
+def convert_numeric(data, dtypes):
+    """Types a raw chunk with the numeric dtypes of its whole sheet, so it matches the same rows of the sheet read whole."""
+    data = data.infer_objects()
+    for name, dtype in dtypes.items():
+        if dtype is not None and name in data.columns:
+            data[name] = pd.to_numeric(data[name]).astype(dtype)
+    return data
+
+
+def _text_dtype():
+    """Returns an Arrow-backed string dtype that keeps NaN for missing values, or None without pyarrow."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except (TypeError, ValueError):
+        # Older pandas spells the same dtype differently, and rejects na_value with either error
+        return pd.StringDtype("pyarrow_numpy")
+
+
+def _optimize_column(column):
+    """Returns the column in the most compact dtype that keeps its values unchanged."""
+    if pd.api.types.is_bool_dtype(column):
+        return column
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast="integer")
+    if pd.api.types.is_float_dtype(column):
+        # Only downcast when every value survives the round trip to float32
+        downcast = column.astype(np.float32)
+        if downcast.astype(column.dtype).equals(column):
+            return downcast
+        return column
+
+    is_text = pd.api.types.is_string_dtype(column)
+    if column.dtype == object:
+        is_text = column.dropna().map(type).eq(str).all()
+    if not is_text:
+        return column  # Mixed text and numbers, dates etc. stay as they are
+
+    # Repeated text such as postcodes and towns is stored once per distinct value
+    if len(column) >= CATEGORY_MIN_ROWS and column.nunique() <= len(column) * CATEGORY_MAX_UNIQUE_RATIO:
+        return column.astype("category")
+    text_dtype = _text_dtype()
+    if column.dtype == object and text_dtype is not None:
+        return column.astype(text_dtype)
+    return column
+
+
+def optimize_dtypes(data):
+    """Returns the frame with compact dtypes: downcast numbers, Arrow strings and categoricals.
+
+    Phone numbers keep their text, so leading zeros and spacing survive into the saved files;
+    they are normalized to integers only where numbers are compared (see dnc_store).
+    """
+    return pd.DataFrame({name: _optimize_column(data[name]) for name in data.columns}, index=data.index, columns=data.columns)
+
+
+def read_header(filepath):
+    """Reads only the header row of the first sheet and returns the column names."""
+    with reader.open_rows(filepath) as rows:
+        header_values = next(rows, None)
+        return _make_header(_trim_row(header_values)) if header_values else []
+
+
+def iter_rows(filepath, columns=None):
+    """Streams the raw cell values of the first sheet row by row, without the header.
+
+    When columns is given only those columns are kept, in that order, so the
+    other columns are never held in memory.
+    """
+    with reader.open_rows(filepath) as rows:
+        header = _make_header(_trim_row(next(rows, None) or ()))
+        indexes = _column_indexes(header, columns) if columns is not None else None
+        for row in _iter_data_rows(rows):
+            if indexes is None:
+                yield _trim_row(row)
+            else:
+                yield tuple(row[i] if i < len(row) else None for i in indexes)
+
+
+def iter_excel_chunks(filepath, chunksize=DEFAULT_CHUNKSIZE, columns=None, convert=True):
+    """Streams the first sheet of a workbook as DataFrames of at most chunksize rows.
+
+    When columns is given only those columns are read into the frames. Each chunk's numeric text is
+    converted on its own, so a column can be typed differently from one chunk to the next; with
+    convert=False the cells are kept as read, in object columns, to be typed for the whole sheet
+    with get_numeric_dtypes, merge_numeric_dtypes and convert_numeric.
+    """
+    with reader.open_rows(filepath) as rows:
+        header_values = next(rows, None)
+        if header_values is None:
+            return
+        header = _make_header(_trim_row(header_values))
+        indexes = None
+        if columns is not None:
+            indexes = _column_indexes(header, columns)
+            header = [header[i] for i in indexes]
+        buffers = [[] for _ in header]
+        buffered_rows = 0
+
+        for row in _iter_data_rows(rows):
+            if indexes is not None:
+                row = [row[i] if i < len(row) else None for i in indexes]
+            else:
+                row = _trim_row(row)
+            if indexes is None and len(row) > len(header):
+                # Rows wider than the header get extra unnamed columns
+                for i in range(len(header), len(row)):
+                    header.append(f"Unnamed: {i}")
+                    buffers.append([None] * buffered_rows)
+
+            for i, buffer in enumerate(buffers):
+                buffer.append(_convert_value(row[i]) if i < len(row) else None)
+            buffered_rows += 1
+
+            if chunksize and buffered_rows >= chunksize:
+                yield _build_frame(header, buffers, convert)
+                buffers = [[] for _ in header]
+                buffered_rows = 0
+
+        if buffered_rows or chunksize is None:
+            yield _build_frame(header, buffers, convert)
+
+
+def read_excel(filepath, use_cache=True):
+    """Loads the first sheet of a workbook into a single DataFrame.
+
+    Unchanged workbooks that were loaded before are read back from the parsed-workbook cache.
+    The columns are stored in compact dtypes (see optimize_dtypes) unless DLBEC_OPTIMIZE_DTYPES=0.
+    """
+    if use_cache:
+        data = cache.load_cached(filepath)
+        if data is not None:
+            return data
+
+    data = next(iter_excel_chunks(filepath, chunksize=None), None)
+    if data is None:
+        data = pd.DataFrame()
+    elif OPTIMIZE_DTYPES:
+        data = optimize_dtypes(data)
+
+    if use_cache:
+        cache.store_cached(filepath, data)
+    return data
+
+
+def run_parallel(func, jobs, max_workers=None, progress=None, report=instrument.NO_REPORT, stage=None, message="Done {name}",
+                 rows=None, initializer=None, initargs=()):
+    """Runs func(*args) for every (key, args) job across a process pool; a job that fails does not stop the others.
+
+    Returns (key, result, error) for every job in the order given, error being None unless the job raised.
+    progress, if given, is called as progress(done, total, message) after each job, with {name} in the
+    message replaced by the base name of the key. An enabled report gets a stage record per job, timed
+    inside the worker, with its rows counted by rows(result) when given. With max_workers=1 or a single
+    job no pool is started and initializer runs in this process.
+    """
+    profiled = report.enabled and stage is not None
+    results = []
+
+    def collect(key, run):
+        try:
+            if profiled:
+                result, record = run()
+                if rows is not None:
+                    record["rows"] = rows(result)
+                report.add(record)
+            else:
+                result = run()
+            results.append((key, result, None))
+        except Exception as e:
+            results.append((key, None, e))
+        if progress:
+            progress(len(results), len(jobs), message.format(name=os.path.basename(str(key))))
+
+    def job_call(key, args):
+        # Profiled jobs are timed inside the worker
+        return (instrument.measured, stage, key, func, *args) if profiled else (func, *args)
+
+    if max_workers == 1 or len(jobs) <= 1:
+        # Not worth starting a pool
+        if initializer is not None:
+            initializer(*initargs)
+        for key, args in jobs:
+            call, *call_args = job_call(key, args)
+            collect(key, lambda: call(*call_args))
+        return results
+
+    executor = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+    try:
+        futures = [executor.submit(*job_call(key, args)) for key, args in jobs]
+        for (key, _), future in zip(jobs, futures):
+            collect(key, future.result)
+    finally:
+        # Jobs not started yet are dropped if the caller stopped early
+        executor.shutdown(cancel_futures=True)
+    return results
+
+
+def load_excel_files_parallel(filepaths, max_workers=DEFAULT_MAX_WORKERS, progress=None, report=instrument.NO_REPORT):
+    """Loads several workbooks across a process pool.
+
+    Returns a list of (filepath, data) pairs in the order the files were given,
+    and a list of (filepath, error) pairs for the files that failed to load.
+    progress, if given, is called as progress(done, total, message) after each file.
+    An enabled report gets a load record per file, timed inside the worker.
+    """
+    results = run_parallel(read_excel, [(filepath, (filepath,)) for filepath in filepaths], max_workers=max_workers,
+                           progress=progress, report=report, stage="load", message="Loaded {name}")
+    files_data = [(filepath, data) for filepath, data, error in results if error is None]
+    errors = [(filepath, error) for filepath, _, error in results if error is not None]
+    return files_data, errors
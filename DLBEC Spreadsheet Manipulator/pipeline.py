@@ -0,0 +1,179 @@
+"""Runs several tools in a row on in-memory data, from a JSON spec, saving only the final outputs.
+
+A spec lists the input workbooks, the steps to run in order and where to save the results:
+
+    {
+        "inputs": ["Leads/monday.xlsx", "Leads/tuesday.xlsx"],
+        "steps": [
+            {"op": "combine", "dedup": ["First Number", "Postcode"]},
+            {"op": "suppress", "dnc_sheet": "DNC/latest.xlsx"},
+            {"op": "extract", "column": "Postcode", "prefix": "BS"},
+            {"op": "omit", "columns": ["Notes"]}
+        ],
+        "output_folder": "Clean Files",
+        "format": "xlsx"
+    }
+
+Relative paths are relative to the spec file. "input_folder" may be given instead of "inputs"
+to use every workbook in a folder. The steps are:
+
+    combine   stack every dataset into one ("dedup" and "keep" as in the combiner)
+    suppress  remove DNC numbers ("dnc_sheet", or the saved DNC list; "column", default "First Number")
+    extract   keep the rows whose "column" matches any postcode in "prefix", e.g. "B, BS, CV1-CV9" or a list
+    split     turn every dataset into one dataset per postcode prefix of "column"
+    omit      drop "columns"
+
+Each remaining dataset is saved as '<name> (<rows>).<format>' in the output folder.
+"""
+import json
+import os
+
+import combiner
+import column_omitter
+import dnc_remover
+import dnc_store
+import extractor
+import instrument
+import loader
+import postcode
+import writer
+
+
+def load_spec(spec_path):
+    """Reads a pipeline spec, resolving its paths relative to the spec file."""
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    base = os.path.dirname(os.path.abspath(spec_path))
+
+    def resolve(path):
+        return os.path.join(base, path)
+
+    if "input_folder" in spec:
+        folder = resolve(spec["input_folder"])
+        spec["inputs"] = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if name.lower().endswith(".xlsx") and not name.startswith("~$")
+        )
+    spec["inputs"] = [resolve(path) for path in spec.get("inputs", [])]
+    spec["output_folder"] = resolve(spec.get("output_folder", "Clean Files"))
+    for step in spec.get("steps", []):
+        if step.get("dnc_sheet"):
+            step["dnc_sheet"] = resolve(step["dnc_sheet"])
+    check_spec(spec)
+    return spec
+
+
+def check_spec(spec):
+    """Raises a ValueError describing the first problem with a spec."""
+    if not spec.get("inputs"):
+        raise ValueError("The pipeline has no input workbooks.")
+    if spec.get("format") and spec["format"] not in writer.FORMATS:
+        raise ValueError(f"Unknown output format '{spec['format']}'. Choose one of: {', '.join(writer.FORMATS)}.")
+    for number, step in enumerate(spec.get("steps", []), start=1):
+        op = step.get("op")
+        if op not in STEPS:
+            raise ValueError(f"Step {number}: unknown operation '{op}'. Choose one of: {', '.join(STEPS)}.")
+        required = {"extract": ("column", "prefix"), "split": ("column",), "omit": ("columns",)}.get(op, ())
+        for key in required:
+            if not step.get(key):
+                raise ValueError(f"Step {number} ({op}) needs '{key}'.")
+        if op == "extract":
+            try:
+                postcode.parse_prefix_spec(step["prefix"])
+            except ValueError as e:
+                raise ValueError(f"Step {number} ({op}): {e}") from None
+
+
+def check_column(datasets, column):
+    for name, data in datasets:
+        if column not in data.columns:
+            raise ValueError(f"Column '{column}' not found in {name}.")
+
+
+def combine_step(datasets, step):
+    combined_data = combiner.combine_data(datasets, step.get("dedup"), step.get("keep", "first"))
+    return [("combined_data", combined_data)]
+
+
+def suppress_step(datasets, step):
+    column = step.get("column", "First Number")
+    if step.get("dnc_sheet"):
+        dnc_numbers = dnc_store.read_dnc_numbers(step["dnc_sheet"])
+    else:
+        dnc_numbers = dnc_store.load_dnc_store()
+    if not len(dnc_numbers):
+        raise ValueError("The DNC list is empty!")
+
+    check_column(datasets, column)
+    suppressed = []
+    for name, data in datasets:
+        if column == "First Number":
+            suppressed.append((name, dnc_remover.remove_dnc_numbers(data, dnc_numbers)))
+        else:
+            suppressed.append((name, data[~dnc_store.is_dnc_number(data[column], dnc_numbers)]))
+    return suppressed
+
+
+def extract_step(datasets, step):
+    prefix = postcode.format_prefix_spec(step["prefix"])
+    check_column(datasets, step["column"])
+    return [
+        (f"{prefix} Postcode" if len(datasets) == 1 else f"{name} {prefix} Postcode",
+         extractor.filter_by_postcode(data, step["column"], prefix))
+        for name, data in datasets
+    ]
+
+
+def split_step(datasets, step):
+    check_column(datasets, step["column"])
+    split = []
+    for name, data in datasets:
+        for prefix, group in extractor.partition_by_postcode(data, step["column"]).items():
+            split.append((f"{prefix} Postcode" if len(datasets) == 1 else f"{name} {prefix} Postcode", group))
+    return split
+
+
+def omit_step(datasets, step):
+    return [(name, column_omitter.omit_columns(data, step["columns"])) for name, data in datasets]
+
+
+STEPS = {
+    "combine": combine_step,
+    "suppress": suppress_step,
+    "extract": extract_step,
+    "split": split_step,
+    "omit": omit_step,
+}
+
+
+def run_pipeline(spec, progress=None, report=instrument.NO_REPORT):
+    """Loads the inputs once, runs every step on the frames in memory and saves what is left.
+
+    Returns the saved paths and a list of (filepath, error) pairs for the inputs that failed to load.
+    progress, if given, is called as progress(done, total, message) after each step and save.
+    """
+    files_data, errors = loader.load_excel_files_parallel(spec["inputs"], report=report)
+    datasets = [(os.path.splitext(os.path.basename(filepath))[0], data) for filepath, data in files_data]
+
+    steps = spec.get("steps", [])
+    for number, step in enumerate(steps, start=1):
+        with report.stage(step["op"]) as record:
+            datasets = STEPS[step["op"]](datasets, step)
+            record["rows"] = sum(len(data) for _, data in datasets)
+        if progress:
+            progress(number, len(steps), f"Finished step {number} ({step['op']})")
+
+    os.makedirs(spec["output_folder"], exist_ok=True)
+    save_paths = []
+    for number, (name, data) in enumerate(datasets, start=1):
+        if data.empty:
+            continue
+        save_path = writer.with_format(os.path.join(spec["output_folder"], f"{name} ({len(data)}).xlsx"), spec.get("format"))
+        with report.stage("save", save_path) as record:
+            writer.write_frame(data, save_path)
+            record["rows"] = len(data)
+        save_paths.append(save_path)
+        if progress:
+            progress(number, len(datasets), f"Saved {os.path.basename(save_path)}")
+    report.save(spec["output_folder"])
+    return save_paths, errors
@@ -0,0 +1,117 @@
+"""Parses UK postcodes into their area, district and outward code, and matches them against lists of prefixes.
+
+A postcode such as "CV10 7AB" has the area "CV", the district "10" and the outward code "CV10".
+Prefixes are given as a list, or a string separated by commas or spaces, of:
+
+    areas            "B"         every postcode in the area, so "B1 1AA" but not "BS1 1AA" or "AB1 1AA"
+    outward codes    "BS1"       every postcode in that district only, so not "BS10 1AA"
+    district ranges  "CV1-CV9"   the districts numbered 1 to 9 of an area (also written "CV1-9")
+
+e.g. "B, BS, CV1-CV9". Every distinct postcode in a column is parsed once, and all the prefixes
+are then resolved together over the parsed parts, so a list of prefixes costs a single pass.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Area letters, district (a number that may end in a letter, as in "EC1A") and the optional inward code
+POSTCODE_RE = r"^(?P<area>[A-Z]{1,2})(?P<district>(?P<number>\d{1,2})[A-Z]?)(?: ?\d[A-Z]{2})?$"
+
+# Area of a value that is not a whole postcode but starts like one, e.g. "BS1 1AA X"
+AREA_RE = r"^([A-Z]{1,2})\d"
+
+AREA_TOKEN_RE = re.compile(r"^[A-Z]{1,2}$")
+OUTWARD_TOKEN_RE = re.compile(r"^[A-Z]{1,2}\d{1,2}[A-Z]?$")
+RANGE_TOKEN_RE = re.compile(r"^([A-Z]{1,2})(\d{1,2})-(?:([A-Z]{1,2}))?(\d{1,2})$")
+
+
+def normalize_postcodes(series):
+    """Returns the postcodes in upper case with surrounding spaces removed and inner spaces collapsed."""
+    return series.astype("string").str.upper().str.strip().str.replace(r"\s+", " ", regex=True)
+
+
+def parse_postcodes(series):
+    """Returns the area, district, number (of the district) and outward code of every postcode in a column.
+
+    Values that are not postcodes have no district or outward code, and no area either unless
+    they start with area letters followed by a digit.
+    """
+    postcodes = normalize_postcodes(series)
+    parts = postcodes.str.extract(POSTCODE_RE)
+    area = parts["area"].fillna(postcodes.str.extract(AREA_RE)[0])
+    return pd.DataFrame({
+        "area": area,
+        "district": parts["district"],
+        "number": pd.to_numeric(parts["number"]),
+        "outward": parts["area"] + parts["district"],
+    }, index=series.index)
+
+
+def parse_prefix_spec(spec):
+    """Splits a prefix list such as "B, BS, CV1-CV9" into (areas, outward codes, district ranges).
+
+    spec may also be a list of such strings. Raises a ValueError naming the first prefix that is
+    not an area, outward code or district range.
+    """
+    if not isinstance(spec, str):
+        spec = ",".join(spec)
+    spec = re.sub(r"\s*-\s*", "-", spec.upper())
+    areas, outwards, ranges = set(), set(), []
+    for token in filter(None, re.split(r"[,;\s]+", spec)):
+        match = RANGE_TOKEN_RE.match(token)
+        if match:
+            area, low, end_area, high = match.group(1), int(match.group(2)), match.group(3), int(match.group(4))
+            if end_area not in (None, area) or low > high:
+                raise ValueError(f"'{token}' is not a range of districts in one area, e.g. 'CV1-CV9'.")
+            ranges.append((area, low, high))
+        elif OUTWARD_TOKEN_RE.match(token):
+            outwards.add(token)
+        elif AREA_TOKEN_RE.match(token):
+            areas.add(token)
+        else:
+            raise ValueError(f"'{token}' is not a postcode area, outward code or range of districts.")
+    if not (areas or outwards or ranges):
+        raise ValueError("No postcode prefixes given.")
+    return areas, outwards, ranges
+
+
+def format_prefix_spec(spec):
+    """Returns a prefix list written out the same way however it was typed, e.g. for file names."""
+    if not isinstance(spec, str):
+        spec = ",".join(spec)
+    parse_prefix_spec(spec)
+    spec = re.sub(r"\s*-\s*", "-", spec.upper())
+    return ", ".join(filter(None, re.split(r"[,;\s]+", spec)))
+
+
+class PostcodeIndex:
+    """The parts of every postcode in a column, parsed once per distinct postcode.
+
+    codes maps every row to its distinct postcode (-1 when missing) and parts holds the area,
+    district, number and outward code of each distinct postcode.
+    """
+
+    def __init__(self, series):
+        self.index = series.index
+        codes, uniques = pd.factorize(series)
+        self.codes = codes
+        self.parts = parse_postcodes(pd.Series(np.asarray(uniques, dtype=object), dtype=object))
+
+    def _take(self, values, missing):
+        # Code -1 picks the value appended for missing postcodes
+        return np.append(values, missing)[self.codes]
+
+    def get_areas(self):
+        """Returns the area of every row, missing when the row has no postcode."""
+        areas = self.parts["area"].astype(object).where(self.parts["area"].notna(), None).to_numpy()
+        return pd.Series(self._take(areas, None), index=self.index, dtype="string")
+
+    def match(self, spec):
+        """Returns a boolean array of the rows whose postcode matches any prefix in spec."""
+        areas, outwards, ranges = parse_prefix_spec(spec)
+        matched = self.parts["area"].isin(areas) | self.parts["outward"].isin(outwards)
+        for area, low, high in ranges:
+            matched |= (self.parts["area"] == area) & self.parts["number"].between(low, high)
+        return self._take(matched.fillna(False).to_numpy(dtype=bool), False)
@@ -0,0 +1,378 @@
+"""Reads the cell values of the first sheet of a workbook, with a choice of engines.
+
+Every engine yields the rows the way openpyxl's read-only iter_rows(values_only=True) does,
+so the frames the loader builds are the same whichever engine read them:
+
+    calamine  the Rust-based python-calamine reader, when it is installed
+    xml       a built-in reader that streams the sheet XML straight out of the zip file
+    openpyxl  openpyxl's read-only mode, the slowest but the most forgiving
+
+DLBEC_READER_ENGINE picks one. The default, auto, uses calamine when it is installed and the
+built-in reader otherwise, and falls back to openpyxl for a workbook the faster engine cannot open.
+"""
+import datetime
+import os
+import posixpath
+import re
+import zipfile
+from contextlib import contextmanager
+from warnings import warn
+from xml.etree.ElementTree import fromstring, iterparse
+
+import openpyxl
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+
+ENGINES = ("calamine", "xml", "openpyxl")
+
+# Engine used to read workbooks: auto, calamine, xml or openpyxl
+READER_ENGINE = os.environ.get("DLBEC_READER_ENGINE", "auto")
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DOC_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+ROW_TAG = f"{MAIN_NS}row"
+VALUE_TAG = f"{MAIN_NS}v"
+TEXT_TAG = f"{MAIN_NS}t"
+RUN_TAG = f"{MAIN_NS}r"
+INLINE_STRING_TAG = f"{MAIN_NS}is"
+
+# Bytes of sheet XML read and parsed at a time by the built-in reader
+BLOCK_SIZE = 1024 * 1024
+
+# The parts of a sheet's XML the built-in reader finds before parsing: the root element, its size and its rows
+ROOT_RE = re.compile(rb"<((?:\w+:)?worksheet)\b[^>]*>")
+DIMENSION_RE = re.compile(rb"<(?:\w+:)?dimension\b[^>]*?\bref=\"([^\"]*)\"")
+SHEET_DATA_RE = re.compile(rb"<(?:(\w+:))?sheetData\b[^>]*?(/)?>")
+
+# Whole numbers read back as floats by calamine are turned into ints below this size, as Excel stores them
+MAX_EXACT_INTEGER = 10 ** 15
+
+
+def get_engines(engine=None):
+    """Returns the engines to try, in order, for the chosen engine (READER_ENGINE by default)."""
+    engine = engine or READER_ENGINE
+    if engine == "auto":
+        try:
+            import python_calamine  # noqa: F401
+            return ["calamine", "openpyxl"]
+        except ImportError:
+            return ["xml", "openpyxl"]
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown reader engine '{engine}'. Choose one of: auto, {', '.join(ENGINES)}.")
+    return [engine]
+
+
+@contextmanager
+def open_rows(filepath, engine=None):
+    """Opens the first sheet of a workbook and yields an iterator over its rows of cell values.
+
+    When several engines are tried, a workbook one engine fails to open is opened with the next;
+    errors once the rows are being read are raised as they are.
+    """
+    engines = get_engines(engine)
+    for i, name in enumerate(engines):
+        try:
+            rows, close = OPENERS[name](filepath)
+            break
+        except Exception:
+            if i == len(engines) - 1:
+                raise
+    try:
+        yield rows
+    finally:
+        close()
+
+
+def _open_openpyxl(filepath):
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+    return workbook.worksheets[0].iter_rows(values_only=True), workbook.close
+
+
+def _calamine_value(value):
+    """Converts a calamine cell value to the one openpyxl gives for the same cell."""
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < MAX_EXACT_INTEGER:
+            return int(value)
+        return value
+    if isinstance(value, str):
+        return value if value else None
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+
+def _open_calamine(filepath):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(filepath)
+    sheet = workbook.get_sheet_by_index(0)
+    # Keep the empty rows and columns around the data, so the header is the first row as in openpyxl
+    rows = (tuple(_calamine_value(value) for value in row) for row in sheet.to_python(skip_empty_area=False))
+    return rows, getattr(workbook, "close", lambda: None)
+
+
+def _resolve_target(base_path, target):
+    """Turns a relationship target into a path inside the zip file."""
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), target))
+
+
+def _read_relationships(archive, part_path):
+    """Returns {id: (type, path)} for the relationships of a part."""
+    folder, name = posixpath.split(part_path)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_path not in archive.namelist():
+        return {}
+    relationships = {}
+    for rel in fromstring(archive.read(rels_path)).iter(f"{REL_NS}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        relationships[rel.get("Id")] = (rel.get("Type", ""), _resolve_target(part_path, rel.get("Target", "")))
+    return relationships
+
+
+def _last_tag_start(data, tag):
+    """Returns where the last element with the given tag starts in the data, or -1."""
+    position = data.rfind(tag)
+    while position >= 0 and data[position + len(tag):position + len(tag) + 1] not in (b" ", b">", b"/", b"\t", b"\r", b"\n"):
+        position = data.rfind(tag, 0, position)
+    return position
+
+
+def _text_content(element):
+    """Returns the text of a string item, joining rich text runs and leaving out phonetic hints."""
+    snippets = []
+    for child in element:
+        if child.tag == TEXT_TAG:
+            snippets.append(child.text or "")
+        elif child.tag == RUN_TAG:
+            text = child.find(TEXT_TAG)
+            if text is not None:
+                snippets.append(text.text or "")
+    return "".join(snippets)
+
+
+class XmlSheetReader:
+    """Streams the cell values of a workbook's first sheet straight from its XML.
+
+    Only what the values need is read: the sheet, the shared strings, the number formats that mark
+    dates, and the workbook's date system. Cells are converted exactly as openpyxl converts them.
+    """
+
+    def __init__(self, filepath):
+        self.archive = zipfile.ZipFile(filepath)
+        try:
+            self._read_workbook()
+        except BaseException:
+            self.archive.close()
+            raise
+        self._column_indexes = {}
+
+    def _read_workbook(self):
+        names = set(self.archive.namelist())
+        workbook_path = "xl/workbook.xml"
+        for rel_type, path in _read_relationships(self.archive, "").values():
+            if rel_type.endswith("/officeDocument"):
+                workbook_path = path
+        workbook = fromstring(self.archive.read(workbook_path))
+        relationships = _read_relationships(self.archive, workbook_path)
+
+        properties = workbook.find(f"{MAIN_NS}workbookPr")
+        date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        self.epoch = CALENDAR_MAC_1904 if date1904 else WINDOWS_EPOCH
+
+        # The first worksheet, skipping chart sheets as openpyxl's worksheets does
+        self.sheet_path = None
+        for sheet in workbook.iter(f"{MAIN_NS}sheet"):
+            rel_type, path = relationships.get(sheet.get(f"{DOC_REL_NS}id"), ("", None))
+            if rel_type.endswith("/worksheet") and path in names:
+                self.sheet_path = path
+                break
+        if self.sheet_path is None:
+            raise ValueError("The workbook has no worksheets.")
+
+        self.shared_strings = []
+        for rel_type, path in relationships.values():
+            if rel_type.endswith("/sharedStrings") and path in names:
+                self.shared_strings = self._read_shared_strings(path)
+
+        self.date_formats = set()
+        self.timedelta_formats = set()
+        if "xl/styles.xml" in names:
+            self._read_styles("xl/styles.xml")
+
+    def _read_shared_strings(self, path):
+        strings = []
+        with self.archive.open(path) as source:
+            for _, element in iterparse(source):
+                if element.tag == f"{MAIN_NS}si":
+                    strings.append(_text_content(element).replace("x005F_", ""))
+                    element.clear()
+        return strings
+
+    def _read_styles(self, path):
+        styles = fromstring(self.archive.read(path))
+        custom_formats = {}
+        number_formats = styles.find(f"{MAIN_NS}numFmts")
+        if number_formats is not None:
+            for number_format in number_formats.iter(f"{MAIN_NS}numFmt"):
+                custom_formats[int(number_format.get("numFmtId"))] = number_format.get("formatCode")
+        cell_formats = styles.find(f"{MAIN_NS}cellXfs")
+        if cell_formats is None:
+            return
+        for style_id, cell_format in enumerate(cell_formats.iter(f"{MAIN_NS}xf")):
+            format_id = int(cell_format.get("numFmtId", 0))
+            fmt = custom_formats[format_id] if format_id in custom_formats else builtin_format_code(format_id)
+            if is_date_format(fmt):
+                self.date_formats.add(style_id)
+            if is_timedelta_format(fmt):
+                self.timedelta_formats.add(style_id)
+
+    def _column_index(self, letters):
+        index = self._column_indexes[letters] = column_index_from_string(letters)
+        return index
+
+    def _cell_value(self, cell, data_type):
+        """Converts a cell the way openpyxl's parser does with data_only set."""
+        if data_type == "inlineStr":
+            child = cell.find(INLINE_STRING_TAG)
+            return None if child is None else _text_content(child)
+
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if data_type == "n":
+            value = float(value) if "." in value or "E" in value or "e" in value else int(value)
+            style_id = int(cell.get("s", 0))
+            if style_id in self.date_formats:
+                try:
+                    value = from_excel(value, self.epoch, timedelta=style_id in self.timedelta_formats)
+                except (OverflowError, ValueError):
+                    warn(f"Cell {cell.get('r')} is marked as a date but the serial value {value} is outside the limits for dates.")
+                    value = "#VALUE!"
+        elif data_type == "s":
+            value = self.shared_strings[int(value)]
+        elif data_type == "b":
+            value = bool(int(value))
+        elif data_type == "d":
+            value = from_ISO8601(value)
+        # Formula results ("str") and errors ("e") keep their text
+        return value
+
+    def _row_values(self, row, max_column):
+        column_indexes = self._column_indexes
+        shared_strings = self.shared_strings
+        cells = []
+        column = 0
+        for cell in row:
+            coordinate = cell.get("r")
+            if coordinate:
+                letters = coordinate.rstrip("0123456789")
+                column = column_indexes.get(letters) or self._column_index(letters)
+            else:
+                column += 1
+
+            # Shared strings and plain numbers are by far the most common cells, so they skip the full conversion
+            data_type = cell.get("t", "n")
+            if data_type == "s":
+                value = cell.findtext(VALUE_TAG)
+                value = shared_strings[int(value)] if value else None
+            elif data_type == "n" and "s" not in cell.attrib:
+                value = cell.findtext(VALUE_TAG)
+                if value:
+                    value = float(value) if "." in value or "E" in value or "e" in value else int(value)
+                else:
+                    value = None
+            else:
+                value = self._cell_value(cell, data_type)
+            cells.append((column, value))
+        if not cells and not max_column:
+            return ()
+
+        # Pad every row to the width of the sheet, as openpyxl does; the loader trims the empty cells at the end
+        width = max_column or cells[-1][0]
+        values = [None] * width
+        for column, value in cells:
+            if 1 <= column <= width:
+                values[column - 1] = value
+        return tuple(values)
+
+    def iter_rows(self):
+        """Yields the rows of the sheet from the first, with missing rows as empty ones.
+
+        The sheet XML is read a block at a time and each block of whole rows is parsed in one go,
+        which is several times faster than handling an event per cell.
+        """
+        with self.archive.open(self.sheet_path) as source:
+            # Everything before the rows: the root element, with its namespaces, and the sheet's size
+            buffer = b""
+            while True:
+                block = source.read(BLOCK_SIZE)
+                buffer += block
+                match = SHEET_DATA_RE.search(buffer)
+                if match or not block:
+                    break
+            if not match or match.group(2):
+                return
+            head = buffer[:match.start()]
+            root = ROOT_RE.search(head)
+            prefix = match.group(1) or b""
+            wrapper_start = root.group(0) + b"<" + prefix + b"sheetData>"
+            wrapper_end = b"</" + prefix + b"sheetData></" + root.group(1) + b">"
+            row_start = b"<" + prefix + b"row"
+            sheet_end = b"</" + prefix + b"sheetData>"
+
+            max_column = max_row = None
+            dimension = DIMENSION_RE.search(head)
+            if dimension:
+                _, _, max_column, max_row = range_boundaries(dimension.group(1).decode())
+            empty_row = (None,) * max_column if max_column is not None else []
+
+            row_number = 0
+            next_row = 1
+            buffer = buffer[match.end():]
+            while True:
+                end = buffer.find(sheet_end)
+                if end >= 0:
+                    segment, last = buffer[:end], True
+                else:
+                    block = source.read(BLOCK_SIZE)
+                    if not block:
+                        segment, last = buffer, True  # A truncated sheet fails to parse below
+                    else:
+                        buffer += block
+                        cut = _last_tag_start(buffer, row_start)
+                        if cut <= 0 or sheet_end in buffer:
+                            continue
+                        # The rows before the last one to start are complete
+                        segment, buffer, last = buffer[:cut], buffer[cut:], False
+
+                for row in fromstring(wrapper_start + segment + wrapper_end)[0]:
+                    number = row.get("r")
+                    row_number = int(float(number)) if number else row_number + 1
+                    if max_row is not None and row_number > max_row:
+                        return
+                    while next_row < row_number:
+                        next_row += 1
+                        yield empty_row
+                    if next_row <= row_number:
+                        next_row += 1
+                        yield self._row_values(row, max_column)
+                if last:
+                    return
+
+    def close(self):
+        self.archive.close()
+
+
+def _open_xml(filepath):
+    sheet_reader = XmlSheetReader(filepath)
+    return sheet_reader.iter_rows(), sheet_reader.close
+
+
+OPENERS = {"calamine": _open_calamine, "xml": _open_xml, "openpyxl": _open_openpyxl}
@@ -0,0 +1,102 @@
+"""Keeps the workbooks loaded in the launcher in memory, so every tool can use them without parsing them again.
+
+The loaded DataFrames are shared by the tools, so they must never be changed in place. Once the
+session holds more than its memory budget, the least recently used workbooks are dropped; a tool
+still working on one keeps its own reference until it is done.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import cache
+import instrument
+import loader
+
+
+# Memory the loaded workbooks may take up before the least recently used are dropped (set DLBEC_SESSION_MEMORY_MB to change it)
+SESSION_MEMORY_LIMIT = int(os.environ.get("DLBEC_SESSION_MEMORY_MB", 1024)) * 1024 * 1024
+
+
+class Session:
+    """The loaded workbooks by path, least recently used first.
+
+    Every method is safe to call from a background task while the UI reads the session.
+    """
+
+    def __init__(self, memory_limit=SESSION_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.entries = OrderedDict()  # Absolute path -> (file identity, data, bytes in memory)
+        self.lock = threading.Lock()
+
+    def get(self, filepath):
+        """Returns the loaded data of a workbook, or None if it is not loaded or has changed since."""
+        key = os.path.abspath(filepath)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != cache.file_identity(filepath):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, filepath, data):
+        """Adds a loaded workbook, dropping the least recently used ones beyond the memory budget."""
+        key = os.path.abspath(filepath)
+        nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            self.entries[key] = (cache.file_identity(filepath), data, nbytes)
+            self.entries.move_to_end(key)
+            # The newest workbook is kept even when it alone is over the budget
+            while len(self.entries) > 1 and self._memory_usage() > self.memory_limit:
+                self.entries.popitem(last=False)
+
+    def discard(self, filepath):
+        with self.lock:
+            self.entries.pop(os.path.abspath(filepath), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _memory_usage(self):
+        return sum(nbytes for _, _, nbytes in self.entries.values())
+
+    def get_memory_usage(self):
+        with self.lock:
+            return self._memory_usage()
+
+    def describe(self):
+        """Returns (filepath, rows, bytes) for every loaded workbook, most recently used last."""
+        with self.lock:
+            return [(key, len(data), nbytes) for key, (_, data, nbytes) in self.entries.items()]
+
+    def load(self, filepaths, max_workers=loader.DEFAULT_MAX_WORKERS, progress=None, report=instrument.NO_REPORT):
+        """Returns the workbooks as load_excel_files_parallel does, only parsing those not already loaded."""
+        loaded = {}
+        for filepath in filepaths:
+            data = self.get(filepath)
+            if data is not None:
+                with report.stage("session", filepath) as record:
+                    record["rows"] = len(data)
+                loaded[filepath] = data
+
+        missing = [filepath for filepath in filepaths if filepath not in loaded]
+        errors = []
+        if missing:
+            files_data, errors = loader.load_excel_files_parallel(missing, max_workers=max_workers, progress=progress, report=report)
+            for filepath, data in files_data:
+                self.put(filepath, data)
+                loaded[filepath] = data
+        elif progress:
+            progress(len(filepaths), len(filepaths), "Already loaded")
+        return [(filepath, loaded[filepath]) for filepath in filepaths if filepath in loaded], errors
+
+    def read_excel(self, filepath):
+        """Returns one workbook as loader.read_excel does, parsing it only if it is not already loaded."""
+        data = self.get(filepath)
+        if data is None:
+            data = loader.read_excel(filepath)
+            self.put(filepath, data)
+        return data
@@ -0,0 +1,173 @@
+import queue
+import threading
+
+
+class TaskCancelled(Exception):
+    """Raised inside a background task once the user has cancelled it."""
+
+
+class BackgroundTask:
+    """Runs a function on a worker thread and passes its progress and result back to the Tk event loop.
+
+    The function is called with the task itself, so it can call report() as it works and
+    check_cancelled() between steps. Every callback runs on the Tk thread.
+    """
+
+    def __init__(self, root, func, on_done=None, on_error=None, on_progress=None, on_cancelled=None, poll_ms=100):
+        self.root = root
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancelled = on_cancelled
+        self.poll_ms = poll_ms
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+
+    def report(self, done, total=None, message=""):
+        """Sends progress to the UI; also the point where a cancelled task stops."""
+        self.messages.put(("progress", (done, total, message)))
+        self.check_cancelled()
+
+    def _run(self):
+        try:
+            result = self.func(self)
+            self.messages.put(("done", result))
+        except TaskCancelled:
+            self.messages.put(("cancelled", None))
+        except Exception as e:
+            self.messages.put(("error", e))
+
+    def _poll(self):
+        # Handle everything the worker has sent since the last poll
+        while True:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                if self.on_progress:
+                    self.on_progress(*value)
+            elif kind == "done":
+                if self.on_done:
+                    self.on_done(value)
+                return
+            elif kind == "error":
+                if self.on_error:
+                    self.on_error(value)
+                return
+            elif kind == "cancelled":
+                if self.on_cancelled:
+                    self.on_cancelled()
+                return
+        self.root.after(self.poll_ms, self._poll)
+
+
+class TaskPanel:
+    """Progress bar, status line and Cancel button that run one background task at a time."""
+
+    def __init__(self, parent):
+        import ttkbootstrap as ttk
+
+        self.root = parent.winfo_toplevel()
+        self.frame = ttk.Frame(parent)
+        self.progress_bar = ttk.Progressbar(self.frame, mode="determinate", length=300, bootstyle="info")
+        self.progress_bar.pack(padx=5, side="left")
+        self.cancel_button = ttk.Button(self.frame, text="Cancel", command=self.cancel, state="disabled", bootstyle="danger")
+        self.cancel_button.pack(padx=5, side="left")
+        self.status_label = ttk.Label(parent, text="", bootstyle="info")
+        self.task = None
+        self.busy_widgets = []
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+        self.status_label.pack(pady=2)
+
+    def is_busy(self):
+        return self.task is not None
+
+    def run(self, func, on_done, description="Working...", busy_widgets=(), error_message="Error"):
+        """Runs func(task) in the background, disabling busy_widgets until it finishes."""
+        from ttkbootstrap.dialogs import Messagebox
+
+        if self.is_busy():
+            Messagebox.show_error("Please wait for the current task to finish.", "Busy")
+            return
+
+        self.busy_widgets = [(widget, str(widget.cget("state"))) for widget in busy_widgets]
+        for widget, _ in self.busy_widgets:
+            widget.config(state="disabled")
+        self.progress_bar.config(value=0, maximum=100)
+        self.status_label.config(text=description)
+        self.cancel_button.config(state="normal")
+
+        def done(result):
+            self._finish("Done.")
+            on_done(result)
+
+        def error(e):
+            self._finish("Failed.")
+            Messagebox.show_error(f"{error_message}: {e}", "Error")
+
+        self.task = BackgroundTask(
+            self.root, func, on_done=done, on_error=error, on_progress=self._show_progress,
+            on_cancelled=lambda: self._finish("Cancelled."),
+        )
+        self.task.start()
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.status_label.config(text="Cancelling...")
+
+    def _show_progress(self, done, total, message):
+        if total:
+            self.progress_bar.config(maximum=total, value=done)
+        if message:
+            self.status_label.config(text=message)
+
+    def _finish(self, status):
+        self.task = None
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text=status)
+        for widget, state in self.busy_widgets:
+            widget.config(state=state)
+        self.busy_widgets = []
+
+
+def choose_excel_file(title="Choose a file"):
+    """Prompts the user to select an Excel file, returning its path."""
+    from tkinter import filedialog
+    from ttkbootstrap.dialogs import Messagebox
+    filepath = filedialog.askopenfilename(title=title, filetypes=[("Excel files", "*.xlsx")])
+    if not filepath:
+        Messagebox.show_error("No file selected!", "Error")
+        return None
+    return filepath
+
+
+def choose_excel_files():
+    """Prompts the user to select multiple Excel files, returning their paths."""
+    from tkinter import filedialog
+    from ttkbootstrap.dialogs import Messagebox
+    filepaths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx")])
+    if not filepaths:
+        Messagebox.show_error("No files selected!", "Error")
+        return None
+    return filepaths
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import openpyxl
+import pytest
+
+# The tools are plain scripts, imported as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keeps the parsed-workbook cache of every test in its own folder."""
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def write_workbook(tmp_path):
+    """Returns a function that saves a header and rows as a workbook in the test folder and returns its path."""
+    def write(name, header, rows):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        if header is not None:
+            sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+        filepath = str(tmp_path / name)
+        workbook.save(filepath)
+        return filepath
+    return write
@@ -0,0 +1,44 @@
+import pandas as pd
+
+import combiner
+import loader
+import writer
+
+
+def read_csv_text(filepath):
+    return pd.read_csv(filepath, dtype=str, keep_default_na=False)
+
+
+def test_out_of_core_combine_matches_combine_data_on_leading_zeros(tmp_path, write_workbook):
+    # Only the last number is not numeric text, so the whole column stays text, leading zeros and all
+    numbers = [f"07123456{i % 1000:03d}" for i in range(2500)]
+    numbers[-1] = "07123 456999"
+    filepaths = [
+        write_workbook("leads.xlsx", ["Telephone Number", "Id"], [[number, i] for i, number in enumerate(numbers)]),
+        write_workbook("more.xlsx", ["Telephone Number", "Id"], [["07000000001", 2500], ["07000000002", 2501]]),
+    ]
+
+    # The smallest memory limit reads the first file in several chunks
+    out_of_core_path = str(tmp_path / "out_of_core.csv")
+    rows_written, _, errors = combiner.combine_files_out_of_core(filepaths, out_of_core_path, memory_limit=1, max_workers=1)
+    assert errors == []
+    assert rows_written == 2502
+
+    files_data, errors = loader.load_excel_files_parallel(filepaths, max_workers=1)
+    in_memory_path = str(tmp_path / "in_memory.csv")
+    writer.write_frame(combiner.combine_data(files_data), in_memory_path)
+
+    result = read_csv_text(out_of_core_path)
+    pd.testing.assert_frame_equal(result, read_csv_text(in_memory_path))
+    assert result["Telephone Number"].tolist()[:2500] == numbers
+
+
+def test_out_of_core_combine_types_numbers_for_the_whole_file(tmp_path, write_workbook):
+    # One blank late in the file makes the whole numbers floats in every chunk, as when loaded whole
+    filepath = write_workbook("ids.xlsx", ["Id"], [[None if i == 2400 else i] for i in range(2500)])
+    out_of_core_path = str(tmp_path / "out_of_core.csv")
+    combiner.combine_files_out_of_core([filepath], out_of_core_path, memory_limit=1, max_workers=1)
+
+    in_memory_path = str(tmp_path / "in_memory.csv")
+    writer.write_frame(loader.read_excel(filepath), in_memory_path)
+    pd.testing.assert_frame_equal(read_csv_text(out_of_core_path), read_csv_text(in_memory_path))
@@ -0,0 +1,113 @@
+import datetime
+import re
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Font
+
+import loader
+import reader
+
+# The engines that must give the same frames; openpyxl is the reference
+ENGINES = ["xml", "calamine"]
+
+
+def read_with(engine, filepath, monkeypatch):
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+    monkeypatch.setattr(reader, "READER_ENGINE", engine)
+    return loader.read_excel(filepath, use_cache=False)
+
+
+def assert_same_as_openpyxl(engine, filepath, monkeypatch):
+    expected = read_with("openpyxl", filepath, monkeypatch)
+    pd.testing.assert_frame_equal(read_with(engine, filepath, monkeypatch), expected)
+    return expected
+
+
+def prefix_namespace(filepath):
+    """Rewrites the first sheet with an "x:" namespace prefix and without the r attributes of its rows and cells."""
+    with zipfile.ZipFile(filepath) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+    sheet = parts["xl/worksheets/sheet1.xml"].decode("utf-8")
+    sheet = re.sub(r"<(/?)(\w+)([\s/>])", r"<\1x:\2\3", sheet)
+    sheet = sheet.replace(' xmlns="', ' xmlns:x="', 1)
+    sheet = re.sub(r'\sr="[^"]*"', "", sheet)
+    parts["xl/worksheets/sheet1.xml"] = sheet.encode("utf-8")
+    with zipfile.ZipFile(filepath, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_values(engine, write_workbook, monkeypatch):
+    filepath = write_workbook("values.xlsx", ["Name", "Phone", "Count", "Price", "Date", "Active", "Note"], [
+        ["Ann", "07123456789", 3, 2.5, datetime.datetime(2024, 1, 31, 9, 30), True, None],
+        ["Bob", "07987 654321", 4, 10.0, datetime.datetime(2023, 12, 1), False, "N/A"],
+        ["Cy", "01234567890", None, -1.25, None, True, "late"],
+    ])
+    data = assert_same_as_openpyxl(engine, filepath, monkeypatch)
+    assert data["Phone"].tolist() == ["07123456789", "07987 654321", "01234567890"]
+    assert data["Note"].isna().tolist() == [True, True, False]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_blank_rows(engine, tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Name", "Town"])
+    sheet.append(["Ann", "Bath"])
+    # A blank row in the middle is kept, formatted blank rows at the end are not
+    sheet.cell(row=3, column=1).font = Font(bold=True)
+    sheet.append(["Bob", "Leeds"])
+    sheet.cell(row=5, column=1).font = Font(bold=True)
+    sheet.cell(row=6, column=2).font = Font(bold=True)
+    filepath = str(tmp_path / "blank_rows.xlsx")
+    workbook.save(filepath)
+
+    data = assert_same_as_openpyxl(engine, filepath, monkeypatch)
+    assert len(data) == 3
+    assert data["Name"].isna().tolist() == [False, True, False]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_duplicate_and_blank_headers(engine, write_workbook, monkeypatch):
+    filepath = write_workbook("headers.xlsx", ["Name", "Name", None, "Name", 5], [["a", "b", "c", "d", "e"]])
+    data = assert_same_as_openpyxl(engine, filepath, monkeypatch)
+    assert list(data.columns) == ["Name", "Name.1", "Unnamed: 2", "Name.2", 5]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_wide_rows(engine, tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Name", "Town"])
+    sheet.append(["Ann", "Bath", None, "extra"])
+    sheet.append(["Bob"])
+    # Formatted empty cells past the data add no columns
+    sheet.cell(row=1, column=8).font = Font(bold=True)
+    sheet.cell(row=3, column=9).font = Font(bold=True)
+    filepath = str(tmp_path / "wide_rows.xlsx")
+    workbook.save(filepath)
+
+    data = assert_same_as_openpyxl(engine, filepath, monkeypatch)
+    assert list(data.columns) == ["Name", "Town", "Unnamed: 2", "Unnamed: 3"]
+    assert data["Unnamed: 3"].tolist()[0] == "extra"
+
+
+def test_namespace_prefix_without_cell_references(write_workbook, monkeypatch):
+    filepath = write_workbook("prefixed.xlsx", ["Name", "Count"], [["Ann", 1], ["Bob", 2], ["Cy", 3]])
+    prefix_namespace(filepath)
+    data = assert_same_as_openpyxl("xml", filepath, monkeypatch)
+    assert data["Count"].tolist() == [1, 2, 3]
+
+
+def test_many_rows_in_several_blocks(write_workbook, monkeypatch):
+    # Enough rows for the built-in reader to parse the sheet XML in several blocks
+    monkeypatch.setattr(reader, "BLOCK_SIZE", 4096)
+    filepath = write_workbook("many.xlsx", ["Id", "Phone", "Town"],
+                              [[i, f"07{i:09d}", ["Bath", "Leeds", None][i % 3]] for i in range(5000)])
+    data = assert_same_as_openpyxl("xml", filepath, monkeypatch)
+    assert len(data) == 5000
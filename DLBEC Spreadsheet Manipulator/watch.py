@@ -0,0 +1,247 @@
+"""Watches a drop folder and runs one operation on every workbook that lands in it.
+
+    python dlbec.py watch FOLDER --op combine|suppress|split [--interval 10] [--once]
+
+The operations are:
+
+    combine   add the new workbooks to the combine store and export 'Combined Files/combined_data.<format>'
+    suppress  remove DNC numbers from the new main sheets in place, as the DNC remover does
+    split     write one file per postcode prefix of the new workbooks into 'Clean Files'
+
+Every workbook handled is recorded by its SHA-256 hash in a manifest in the folder
+(.dlbec_<operation>_manifest.json). A file whose size and modification time have not changed
+is skipped without being read, and a file whose content was already processed, under any name,
+is skipped without being parsed. Outputs written into the folder are recorded too, so they are
+not picked up again.
+"""
+import json
+import os
+import time
+
+import cache
+import combine_store
+import combiner
+import dnc_remover
+import dnc_store
+import extractor
+import instrument
+import loader
+
+
+# Seconds between two looks at the folder (set DLBEC_WATCH_INTERVAL to change it)
+DEFAULT_INTERVAL = float(os.environ.get("DLBEC_WATCH_INTERVAL", 10))
+
+# A file modified more recently than this may still be being copied in, so it waits for the next look
+SETTLE_SECONDS = 2
+
+OPERATIONS = ("combine", "suppress", "split")
+
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(folder, operation):
+    return os.path.join(folder, f".dlbec_{operation}_manifest.json")
+
+
+def load_manifest(folder, operation):
+    """Reads the manifest of the files already processed, or starts an empty one."""
+    manifest_path = get_manifest_path(folder, operation)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return {"version": MANIFEST_VERSION, "operation": operation, "files": {}}
+
+
+def save_manifest(folder, manifest):
+    """Saves the manifest, replacing the old one only once the new one is fully written."""
+    cache.save_json(get_manifest_path(folder, manifest["operation"]), manifest)
+
+
+def find_workbooks(folder):
+    """Returns the workbooks directly inside the folder; the output subfolders are not watched."""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(".xlsx") and not name.startswith("~$")
+    )
+
+
+def record_file(manifest, filepath, sha256=None, **details):
+    """Records a file in the manifest with its hash, size and modification time."""
+    stat = os.stat(filepath)
+    entry = {
+        "sha256": sha256 or cache.file_sha256(filepath),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "processed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    entry.update(details)
+    manifest["files"][os.path.basename(filepath)] = entry
+    return entry
+
+
+def find_new_files(folder, manifest, now=None):
+    """Returns (filepath, sha256) for every workbook that is new or changed since it was processed.
+
+    Unchanged files are recognised by size and modification time alone; changed ones are hashed
+    and skipped if the same content was processed before. Files still being written are left for later.
+    """
+    now = time.time() if now is None else now
+    processed_hashes = {entry["sha256"] for entry in manifest["files"].values()}
+    new_files = []
+    for filepath in find_workbooks(folder):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue  # Moved or deleted since the folder was listed
+        entry = manifest["files"].get(os.path.basename(filepath))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+        if now - stat.st_mtime < SETTLE_SECONDS:
+            continue
+
+        try:
+            sha256 = cache.file_sha256(filepath)
+        except OSError:
+            continue  # Gone or still locked, so it is looked at again next time
+        if sha256 in processed_hashes:
+            # Same content as a file already processed, e.g. a copy or a touched file
+            record_file(manifest, filepath, sha256, skipped="already processed")
+            continue
+        processed_hashes.add(sha256)  # A copy dropped alongside it is only processed once
+        new_files.append((filepath, sha256))
+    return new_files
+
+
+class FolderWatcher:
+    """Runs one operation on the new workbooks of a folder, keeping the manifest up to date."""
+
+    def __init__(self, folder, operation, fmt=None, column="Postcode", dnc_sheet=None, dedup_columns=None, keep="first", log=print):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}'. Choose one of: {', '.join(OPERATIONS)}.")
+        self.folder = os.path.abspath(folder)
+        self.operation = operation
+        self.fmt = fmt
+        self.column = column
+        self.dnc_sheet = dnc_sheet
+        self.dedup_columns = dedup_columns
+        self.keep = keep
+        self.log = log
+        self.manifest = load_manifest(self.folder, operation)
+
+    def poll(self, report=instrument.NO_REPORT):
+        """Processes the files that are new since the last poll and returns how many were handled.
+
+        The manifest is saved even when the operation fails, so the files it did finish are not processed again.
+        """
+        new_files = find_new_files(self.folder, self.manifest)
+        try:
+            if new_files:
+                getattr(self, f"_{self.operation}")(new_files, report)
+        finally:
+            save_manifest(self.folder, self.manifest)
+        return len(new_files)
+
+    def run(self, interval=None, once=False, profile=None):
+        """Polls the folder until interrupted, or just once, returning whether that poll succeeded.
+
+        An error in one poll, e.g. the combined file being open in Excel, is logged and the
+        files it affected are tried again at the next poll.
+        """
+        self.log(f"Watching {self.folder} ({self.operation})")
+        while True:
+            report = instrument.RunReport(f"watch_{self.operation}", enabled=profile)
+            ok = True
+            try:
+                if self.poll(report):
+                    report.save(self.get_output_folder())
+            except Exception as e:
+                self.log(f"Error watching {self.folder}: {e}")
+                ok = False
+            if once:
+                return ok
+            time.sleep(interval or DEFAULT_INTERVAL)
+
+    def get_output_folder(self):
+        return os.path.join(self.folder, "Combined Files" if self.operation == "combine" else "Clean Files")
+
+    def _failed(self, filepath, sha256, e):
+        # Recorded with its hash, so it is only tried again once the file changes
+        self.log(f"Error processing {os.path.basename(filepath)}: {e}")
+        record_file(self.manifest, filepath, sha256, error=str(e))
+
+    def _combine(self, new_files, report):
+        # Only the new files are read; the combined file is exported again from the store
+        store = combine_store.CombineStore(combine_store.get_store_folder(os.path.join(self.folder, "combined_data")))
+        added, errors = store.update([filepath for filepath, _ in new_files], report=report)
+        failed = dict(errors)
+        for filepath, sha256 in new_files:
+            if filepath in failed:
+                self._failed(filepath, sha256, failed[filepath])
+
+        # Also files added by an earlier poll whose export failed, e.g. while the combined file was open
+        in_store = [(filepath, sha256) for filepath, sha256 in new_files
+                    if store.sources.get(os.path.abspath(filepath), {}).get("sha256") == sha256]
+        save_path = combiner.get_combined_save_path_for_file(os.path.join(self.folder, "combined_data"), self.fmt)
+        if in_store:
+            with report.stage("export", save_path) as record:
+                rows_written, _ = store.export(save_path, self.dedup_columns, self.keep)
+                record["rows"] = rows_written
+            self.log(f"Appended {len(in_store)} files to {save_path} ({rows_written} rows)")
+
+        for filepath, sha256 in new_files:
+            if (filepath, sha256) in in_store:
+                record_file(self.manifest, filepath, sha256, rows=store.sources[os.path.abspath(filepath)]["rows"], outputs=[save_path])
+            elif filepath not in failed:
+                record_file(self.manifest, filepath, sha256, skipped="already in the combine store")
+
+    def _suppress(self, new_files, report):
+        # Loaded on every poll, so numbers added to the saved DNC list are used straight away
+        if self.dnc_sheet:
+            dnc_numbers = report.run("load dnc", self.dnc_sheet, dnc_store.read_dnc_numbers, self.dnc_sheet)
+        else:
+            dnc_numbers = report.run("load dnc", dnc_store.DNC_STORE_PATH, dnc_store.load_dnc_store)
+        if not len(dnc_numbers):
+            self.log("The DNC list is empty!")
+            return
+
+        for filepath, sha256 in new_files:
+            try:
+                main_data = report.run("load", filepath, loader.read_excel, filepath, False)
+                entries_removed, new_filename = dnc_remover.suppress_main_sheet(filepath, main_data, dnc_numbers, self.fmt, report=report)
+            except Exception as e:
+                self._failed(filepath, sha256, e)
+                continue
+
+            if new_filename is None:
+                record_file(self.manifest, filepath, sha256, rows=len(main_data), entries_removed=0)
+                self.log(f"{os.path.basename(filepath)}: no entries removed")
+                continue
+            # The original is replaced by the suppressed sheet, which must not be suppressed again
+            new_filepath = os.path.join(self.folder, new_filename)
+            self.manifest["files"][os.path.basename(filepath)] = {
+                "sha256": sha256, "size": None, "mtime_ns": None, "processed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "entries_removed": entries_removed, "outputs": [new_filepath],
+            }
+            if new_filename.lower().endswith(".xlsx"):
+                record_file(self.manifest, new_filepath, source=os.path.basename(filepath))
+            self.log(f"{os.path.basename(filepath)}: {entries_removed} entries removed, saved as {new_filename}")
+
+    def _split(self, new_files, report):
+        for filepath, sha256 in new_files:
+            try:
+                data = report.run("load", filepath, loader.read_excel, filepath, False)
+                with report.stage("partition", filepath) as record:
+                    partitions = extractor.partition_by_postcode(data, self.column)
+                    record["rows"] = len(data)
+                with report.stage("save", filepath) as record:
+                    save_paths, errors = extractor.save_partitions(partitions, filepath, fmt=self.fmt)
+                    record["rows"] = len(data)
+                if errors:
+                    raise ValueError("; ".join(f"{prefix}: {e}" for prefix, e in errors))
+            except Exception as e:
+                self._failed(filepath, sha256, e)
+                continue
+            record_file(self.manifest, filepath, sha256, rows=len(data), outputs=save_paths)
+            self.log(f"{os.path.basename(filepath)}: split into {len(save_paths)} postcode files")
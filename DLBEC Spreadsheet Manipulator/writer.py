@@ -0,0 +1,269 @@
+import csv
+import os
+
+import openpyxl
+
+
+# Output formats every save path can write; the extension of the save path picks the format
+FORMATS = ("xlsx", "csv", "parquet")
+
+# Format used when a run does not choose one (set DLBEC_OUTPUT_FORMAT to change it)
+DEFAULT_FORMAT = os.environ.get("DLBEC_OUTPUT_FORMAT", "xlsx")
+
+# How often write_rows reports progress
+PROGRESS_EVERY_ROWS = 10000
+
+# Rows collected into each Parquet row group when rows are written one at a time
+PARQUET_ROW_GROUP_ROWS = 50000
+
+
+def with_format(save_path, fmt=None):
+    """Returns the save path with the extension of the chosen output format."""
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format '{fmt}'. Choose one of: {', '.join(FORMATS)}.")
+    return f"{os.path.splitext(save_path)[0]}.{fmt}"
+
+
+def iter_frame_rows(df):
+    """Yields the rows of a DataFrame as tuples, with missing values as None so they save as empty cells."""
+    values = df.astype(object).where(df.notna(), None)
+    yield from values.itertuples(index=False, name=None)
+
+
+class XlsxOutput:
+    """Writes an Excel file row by row in constant memory.
+
+    Uses xlsxwriter's constant_memory mode when it is installed, otherwise an openpyxl write-only workbook.
+    """
+
+    def __init__(self, save_path, columns):
+        self.save_path = save_path
+        try:
+            import xlsxwriter
+        except ImportError:
+            xlsxwriter = None
+
+        if xlsxwriter is not None:
+            self.workbook = xlsxwriter.Workbook(save_path, {
+                "constant_memory": True,
+                "default_date_format": "yyyy-mm-dd hh:mm:ss",
+                "remove_timezone": True,
+                "strings_to_numbers": False,
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+            })
+            self.sheet = self.workbook.add_worksheet()
+            self.next_row = 0
+            self.write_row = self._write_xlsxwriter_row
+        else:
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.sheet = self.workbook.create_sheet()
+            self.write_row = self.sheet.append
+        self.write_row(list(columns))
+
+    def _write_xlsxwriter_row(self, row):
+        self.sheet.write_row(self.next_row, 0, row)
+        self.next_row += 1
+
+    def close(self):
+        if isinstance(self.workbook, openpyxl.Workbook):
+            self.workbook.save(self.save_path)
+        else:
+            self.workbook.close()
+
+
+class CsvOutput:
+    """Writes a CSV file row by row."""
+
+    def __init__(self, save_path, columns):
+        self.file = open(save_path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+def _parquet_array(column):
+    """Returns a column as an Arrow array: numbers, booleans and dates keep their type, anything else is saved as text."""
+    import pandas as pd
+    import pyarrow as pa
+
+    if not isinstance(column.dtype, pd.CategoricalDtype) and (
+            pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column)):
+        try:
+            return pa.array(column, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    present = column.notna().to_numpy()
+    if not present.any():
+        return pa.nulls(len(column))
+    # Columns mixing text and numbers are saved as text
+    return pa.array([str(value) if keep else None for value, keep in zip(column.astype(object).to_numpy(), present)], type=pa.string())
+
+
+def _wider_parquet_type(old_type, new_type):
+    """Returns a type both column types can be cast to: the other type for an empty column, float for two number types, otherwise text."""
+    import pyarrow as pa
+
+    if pa.types.is_null(old_type):
+        return new_type
+    if pa.types.is_null(new_type):
+        return old_type
+    numeric = (pa.types.is_integer(old_type) or pa.types.is_floating(old_type)) and (pa.types.is_integer(new_type) or pa.types.is_floating(new_type))
+    return pa.float64() if numeric else pa.string()
+
+
+class ParquetOutput:
+    """Writes a Parquet file (needs pyarrow) one row group at a time, in memory proportional to a single frame.
+
+    The column types come from the first rows written. When later rows do not fit a column's type,
+    e.g. text after numbers, the row groups already written are rewritten once with the wider type.
+    """
+
+    def __init__(self, save_path, columns):
+        self.save_path = save_path
+        self.columns = [str(col) for col in columns]
+        self.schema = None
+        self.writer = None
+        self.rows = []  # Rows passed one at a time, written as a row group every PARQUET_ROW_GROUP_ROWS
+
+    def write_row(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush_rows()
+
+    def _flush_rows(self):
+        import pandas as pd
+        if self.rows:
+            self.write_frame(pd.DataFrame.from_records(self.rows, columns=self.columns))
+            self.rows = []
+
+    def write_frame(self, df):
+        """Writes a DataFrame, whose columns are in the output's column order, as one row group."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrays = [_parquet_array(df.iloc[:, i]) for i in range(len(self.columns))]
+        if self.schema is None:
+            self.schema = pa.schema([pa.field(name, array.type) for name, array in zip(self.columns, arrays)])
+            self.writer = pq.ParquetWriter(self.save_path, self.schema)
+
+        cast_arrays = []
+        wider_fields = []
+        for field, array in zip(self.schema, arrays):
+            try:
+                cast_arrays.append(array if array.type == field.type else array.cast(field.type))
+                wider_fields.append(field)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                cast_arrays.append(None)
+                wider_fields.append(pa.field(field.name, _wider_parquet_type(field.type, array.type)))
+        if any(array is None for array in cast_arrays):
+            self._widen(pa.schema(wider_fields))
+            cast_arrays = [array if array.type == field.type else array.cast(field.type) for field, array in zip(self.schema, arrays)]
+        self.writer.write_table(pa.Table.from_arrays(cast_arrays, schema=self.schema))
+
+    def _widen(self, schema):
+        """Rewrites the row groups written so far with the wider schema, one row group at a time."""
+        import pyarrow.parquet as pq
+
+        self.writer.close()
+        old_path = f"{self.save_path}.{os.getpid()}.tmp"
+        os.replace(self.save_path, old_path)
+        try:
+            self.writer = pq.ParquetWriter(self.save_path, schema)
+            old_file = pq.ParquetFile(old_path)
+            for i in range(old_file.num_row_groups):
+                self.writer.write_table(old_file.read_row_group(i).cast(schema))
+            old_file.close()
+        finally:
+            os.remove(old_path)
+        self.schema = schema
+
+    def close(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._flush_rows()
+        if self.writer is None:
+            # Nothing was written, so the columns are saved as empty text columns
+            self.schema = pa.schema([pa.field(name, pa.string()) for name in self.columns])
+            self.writer = pq.ParquetWriter(self.save_path, self.schema)
+            self.writer.write_table(self.schema.empty_table())
+        self.writer.close()
+
+
+OUTPUTS = {"xlsx": XlsxOutput, "csv": CsvOutput, "parquet": ParquetOutput}
+
+
+def open_output(save_path, columns):
+    """Opens the output backend matching the save path's extension."""
+    fmt = os.path.splitext(save_path)[1].lstrip(".").lower()
+    if fmt not in OUTPUTS:
+        raise ValueError(f"Unknown output format '{fmt}'. Choose one of: {', '.join(FORMATS)}.")
+    return OUTPUTS[fmt](save_path, columns)
+
+
+def write_rows(save_path, columns, rows, total_rows=None, progress=None):
+    """Streams rows of values into the output file under a single header row.
+
+    progress, if given, is called as progress(rows_written, total_rows, message) as rows are written.
+    """
+    output = open_output(save_path, columns)
+    rows_written = 0
+    try:
+        for row in rows:
+            output.write_row(row)
+            rows_written += 1
+            if progress and rows_written % PROGRESS_EVERY_ROWS == 0:
+                progress(rows_written, total_rows, f"Written {rows_written} rows")
+        if progress:
+            progress(rows_written, total_rows, "Saving file...")
+    except BaseException:
+        _discard_output(output, save_path)
+        raise
+    output.close()
+    return rows_written
+
+
+def _discard_output(output, save_path):
+    # Do not leave a half-written file behind when a write fails or is cancelled
+    try:
+        output.close()
+    finally:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+
+
+def write_frames(save_path, columns, frames, total_rows=None, progress=None):
+    """Streams a sequence of DataFrames into the output file under a single header row.
+
+    Parquet takes every frame whole, as one row group; the other formats write it row by row.
+    """
+    if os.path.splitext(save_path)[1].lower() != ".parquet":
+        rows = (row for df in frames for row in iter_frame_rows(df))
+        return write_rows(save_path, columns, rows, total_rows=total_rows, progress=progress)
+
+    output = ParquetOutput(save_path, columns)
+    rows_written = 0
+    try:
+        for df in frames:
+            output.write_frame(df)
+            rows_written += len(df)
+            if progress:
+                progress(rows_written, total_rows, f"Written {rows_written} rows")
+    except BaseException:
+        _discard_output(output, save_path)
+        raise
+    output.close()
+    return rows_written
+
+
+def write_frame(df, save_path, progress=None):
+    """Writes a single DataFrame to the output file and returns the save path."""
+    write_frames(save_path, list(df.columns), [df], total_rows=len(df), progress=progress)
+    return save_path